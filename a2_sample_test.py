@@ -1,9 +1,17 @@
+import json
 import os
+import pytest
 
 from hypothesis import given
 from hypothesis.strategies import integers
-from typing import Tuple
+from typing import List, Tuple
 from tm_trees import TMTree, FileSystemTree
+from search_index import SearchIndex
+from file_views import build_view
+from snapshots import diff_snapshots, diff_trees, save_snapshot
+from tm_profiler import Profiler
+import treemap_visualiser
+import benchmark
 
 
 # This should be the path to the "workshop" folder in the sample data.
@@ -80,6 +88,447 @@ def test_example_data_rectangles() -> None:
         assert expected_rects[i] == actual_rects[i]
 
 
+def test_iter_displayed_leaves() -> None:
+    """Test that the displayed leaves are streamed in the same order as the
+    rectangles are listed."""
+    tree = FileSystemTree(EXAMPLE_PATH)
+    _sort_subtrees(tree)
+    tree.update_rectangles((0, 0, 200, 100))
+    assert list(tree.iter_displayed_leaves()) == [tree]
+
+    tree.expand_all()
+    leaves = list(tree.iter_displayed_leaves())
+    assert [leaf._name for leaf in leaves] == [
+        'Plan.tex', 'Q2.pdf', 'Q3.pdf', 'draft.pptx', 'Cats.pdf',
+        'reading.md']
+    assert list(tree.iter_rectangles()) == tree.get_rectangles()
+    assert [rect for rect, _ in tree.iter_rectangles()] == \
+        [leaf.rect for leaf in leaves]
+
+
+def test_batch_commits_once() -> None:
+    """Test that a batch of edits updates sizes and rectangles on commit."""
+    tree = FileSystemTree(EXAMPLE_PATH)
+    _sort_subtrees(tree)
+    tree.update_rectangles((0, 0, 200, 100))
+    activities, draft, prep = tree._subtrees
+    old_rect = draft.rect
+
+    with tree.batch((0, 0, 200, 100)) as batch:
+        for _ in range(10):
+            batch.change_size(draft, 0.01)
+        tree.expand()
+        assert batch.is_dirty()
+        # nothing is updated until the batch is committed
+        assert tree.data_size == 151
+        assert draft.rect == old_rect
+
+    assert not batch.is_dirty()
+    assert draft.data_size == 68
+    assert tree.data_size == 161
+    assert draft.rect != old_rect
+    assert tree._expanded
+
+
+def test_batch_updates_only_ancestor_sizes(monkeypatch) -> None:
+    """Test that committing resizes updates the ancestors of the resized
+    leaves without walking the whole tree, including for a leaf that is
+    moved after being resized."""
+    tree = FileSystemTree(EXAMPLE_PATH)
+    _sort_subtrees(tree)
+    activities, draft, prep = tree._subtrees
+    reading = prep._subtrees[1]
+    monkeypatch.setattr(TMTree, 'update_data_sizes', None)
+
+    with tree.batch((0, 0, 200, 100)) as batch:
+        batch.change_size(reading, 1.0)
+        batch.change_size(draft, 1.0)
+        batch.move(draft, activities)
+        # a folder's size is the sum of its subtrees, so it is not resized
+        batch.change_size(prep, 1.0)
+
+    assert reading.data_size == 12 and draft.data_size == 116
+    assert prep.data_size == 16 + 12
+    assert activities.data_size == 71 + 116
+    assert tree.data_size == 151 + 6 + 58
+    for node in _preorder(tree):
+        if node._subtrees:
+            assert node.data_size == sum(t.data_size for t in node._subtrees)
+
+
+def test_move_updates_parents_and_sizes() -> None:
+    """Test that a moved leaf has its new parent, and that the sizes of its
+    old and new ancestors are updated without update_data_sizes."""
+    tree = FileSystemTree(EXAMPLE_PATH)
+    _sort_subtrees(tree)
+    activities, draft, prep = tree._subtrees
+    images = prep._subtrees[0]
+    cats = images._subtrees[0]
+    old_activities_size = activities.data_size
+    old_prep_size = prep.data_size
+
+    cats.move(activities)
+    assert cats._parent_tree is activities
+    assert activities._subtrees[-1] is cats
+    assert cats not in images._subtrees
+    assert images._subtrees == []
+    assert activities.data_size == old_activities_size + cats.data_size
+    assert prep.data_size == old_prep_size - cats.data_size
+    assert tree.data_size == 151
+
+    # moving it again uses the new parent, not the original one
+    cats.move(prep)
+    assert cats._parent_tree is prep
+    assert activities.data_size == old_activities_size
+    assert prep.data_size == old_prep_size
+    assert tree.update_data_sizes() == 151
+
+
+def test_subtree_list() -> None:
+    """Test the list operations of the subtrees of a tree."""
+    tree = FileSystemTree(EXAMPLE_PATH)
+    _sort_subtrees(tree)
+    activities, draft, prep = tree._subtrees
+    subtrees = tree._subtrees
+
+    assert len(subtrees) == 3
+    assert subtrees[0] is activities and subtrees[-1] is prep
+    assert subtrees[1:] == [draft, prep]
+    assert draft in subtrees and tree not in subtrees
+    assert subtrees.index(prep) == 2 and subtrees.index(draft, -2) == 1
+    assert subtrees.count(draft) == 1 and subtrees.count(tree) == 0
+    with pytest.raises(ValueError):
+        subtrees.index(activities, 1)
+
+    subtrees.remove(draft)
+    subtrees.append(draft)
+    assert subtrees == [activities, prep, draft]
+    with pytest.raises(ValueError):
+        subtrees.remove(tree)
+    with pytest.raises(IndexError):
+        subtrees[3]
+
+
+def test_colours_are_deterministic() -> None:
+    """Test that colours depend only on each tree's path, depth or
+    extension, and not on when it was built."""
+    tree1 = FileSystemTree(EXAMPLE_PATH)
+    tree2 = FileSystemTree(EXAMPLE_PATH)
+    _sort_subtrees(tree1)
+    _sort_subtrees(tree2)
+    tree1.assign_colours()
+
+    colours1 = [t._colour for t in _preorder(tree1)]
+    # the colours of tree2 are assigned lazily, on first use
+    colours2 = [t._colour for t in _preorder(tree2)]
+    assert colours1 == colours2
+    assert all(is_valid_colour(colour) for colour in colours1)
+    assert len(set(colours1)) == len(colours1)
+
+    tree1.assign_colours('depth')
+    activities, draft, prep = tree1._subtrees
+    assert activities._colour == draft._colour != tree1._colour
+
+    tree1.assign_colours('extension')
+    cats = prep._subtrees[0]._subtrees[0]
+    q2 = activities._subtrees[1]._subtrees[0]
+    assert cats._colour == q2._colour != draft._colour
+
+    with pytest.raises(ValueError):
+        tree1.assign_colours('random')
+
+
+def test_search_index() -> None:
+    """Test substring, glob and path queries on the example data."""
+    tree = FileSystemTree(EXAMPLE_PATH)
+    index = SearchIndex(tree)
+    assert len(index) == 11
+
+    assert [t._name for t in index.search('READ')] == ['reading.md']
+    assert sorted(t._name for t in index.search('*.pdf')) == \
+        ['Cats.pdf', 'Q2.pdf', 'Q3.pdf']
+    assert sorted(t._name for t in index.search('q?.pdf')) == \
+        ['Q2.pdf', 'Q3.pdf']
+    assert index.search('nothing') == []
+
+    path = os.path.join('workshop', 'prep', 'images')
+    images = index.find_path(path)
+    assert images._name == 'images'
+    assert [t._name for t in index.search(path + os.sep)] == ['Cats.pdf']
+    assert [t._name for t in index.search(os.path.join('P', 'IMAG'))] == \
+        ['images', 'Cats.pdf']
+    assert sorted(t._name for t in index.search(os.path.join('*', '*.pdf'))) \
+        == ['Cats.pdf', 'Q2.pdf', 'Q3.pdf']
+    assert [t._name for t in index.search(os.path.join('*s', 'c*'))] == \
+        ['Cats.pdf']
+
+
+def test_search_index_move() -> None:
+    """Test that the index follows a leaf that has been moved."""
+    tree = FileSystemTree(EXAMPLE_PATH)
+    index = SearchIndex(tree)
+    draft = index.find_path(os.path.join('workshop', 'draft.pptx'))
+    prep = index.find_path(os.path.join('workshop', 'prep'))
+
+    draft.move(prep)
+    index.update_path(draft, prep)
+    assert index.find_path(os.path.join('workshop', 'draft.pptx')) is None
+    assert index.find_path(os.path.join('workshop', 'prep',
+                                        'draft.pptx')) is draft
+
+
+def test_search_index_rename() -> None:
+    """Test that the index follows a folder that has been renamed."""
+    tree = FileSystemTree(EXAMPLE_PATH)
+    index = SearchIndex(tree)
+    prep = index.find_path(os.path.join('workshop', 'prep'))
+
+    index.rename(prep, 'Setup')
+    assert prep.get_path_string() == \
+        os.path.join('workshop', 'Setup') + ' (folder)'
+    assert index.find_path(os.path.join('workshop', 'prep')) is None
+    assert index.find_path(os.path.join('workshop', 'Setup')) is prep
+    assert [t._name for t in index.search('setu')] == ['Setup']
+    assert index.search('prep') == []
+    assert [t._name for t in index.search(os.path.join('setup', 'read'))] \
+        == ['reading.md']
+
+
+def test_path_string_after_move_and_rename() -> None:
+    """Test that cached path strings follow moves and renames."""
+    tree = FileSystemTree(EXAMPLE_PATH)
+    _sort_subtrees(tree)
+    activities, draft, prep = tree._subtrees
+    reading = prep._subtrees[1]
+
+    assert draft.get_path_string() == \
+        os.path.join('workshop', 'draft.pptx') + ' (file)'
+    assert reading.get_path_string() == \
+        os.path.join('workshop', 'prep', 'reading.md') + ' (file)'
+    # only folders cache their path, which their files share as a prefix
+    assert prep._path == os.path.join('workshop', 'prep')
+    assert reading._path is None
+
+    draft.move(activities)
+    assert draft.get_path_string() == \
+        os.path.join('workshop', 'activities', 'draft.pptx') + ' (file)'
+
+    prep.rename('setup')
+    assert prep.get_path_string() == \
+        os.path.join('workshop', 'setup') + ' (folder)'
+    assert reading.get_path_string() == \
+        os.path.join('workshop', 'setup', 'reading.md') + ' (file)'
+
+
+def test_file_attributes() -> None:
+    """Test the attributes recorded for each file during the scan."""
+    path = os.path.join(EXAMPLE_PATH, 'draft.pptx')
+    tree = FileSystemTree(path)
+    assert tree.extension == '.pptx'
+    assert tree.uid == os.stat(path).st_uid
+    assert tree.mtime == int(os.stat(path).st_mtime)
+
+
+def test_hard_links_counted_once(tmp_path) -> None:
+    """Test that a file with two hard links is counted once when links are
+    deduplicated, and at each link otherwise."""
+    (tmp_path / 'data.bin').write_bytes(b'x' * 100)
+    os.link(str(tmp_path / 'data.bin'), str(tmp_path / 'link.bin'))
+
+    assert FileSystemTree(str(tmp_path)).data_size == 200
+    tree = FileSystemTree(str(tmp_path), dedupe_links=True)
+    assert tree.data_size == 100
+    assert sorted(t.data_size for t in tree._subtrees) == [0, 100]
+
+
+@pytest.mark.skipif(not hasattr(os.stat_result, 'st_blocks'),
+                    reason='st_blocks is not reported on this OS')
+def test_use_blocks(tmp_path, monkeypatch) -> None:
+    """Test that a sparse file is sized by its allocated blocks when blocks
+    are used, and by its length otherwise."""
+    path = tmp_path / 'sparse.bin'
+    with open(str(path), 'wb') as sparse_file:
+        sparse_file.truncate(1 << 20)
+    blocks = os.stat(str(path)).st_blocks
+
+    assert FileSystemTree(str(path)).data_size == 1 << 20
+    assert FileSystemTree(str(path), use_blocks=True).data_size == \
+        blocks * 512
+
+    trees = []
+    monkeypatch.setattr(treemap_visualiser, 'run_visualisation',
+                        trees.append)
+    treemap_visualiser.run_treemap_file_system(str(tmp_path),
+                                               use_blocks=True)
+    assert trees[0].data_size == blocks * 512
+
+
+def test_file_views() -> None:
+    """Test views grouping the example data by extension and directory."""
+    tree = FileSystemTree(EXAMPLE_PATH)
+    view = build_view(tree, ['extension'])
+    assert view.data_size == 151
+    sizes = {t._name: t.data_size for t in view._subtrees}
+    assert sorted(sizes) == ['.md', '.pdf', '.pptx', '.tex']
+    assert sizes['.pptx'] == 58
+
+    view = build_view(tree, ['extension', 'directory'])
+    pdf = [t for t in view._subtrees if t._name == '.pdf'][0]
+    assert sorted(t._name for t in pdf._subtrees) == [
+        os.path.join('workshop', 'activities', 'images'),
+        os.path.join('workshop', 'prep', 'images')]
+    for subtree in pdf._subtrees:
+        assert subtree._parent_tree is pdf
+
+
+def test_file_views_skip_empty_folders(tmp_path) -> None:
+    """Test that an empty folder is not counted as a file in a view."""
+    (tmp_path / 'sub').mkdir()
+    (tmp_path / 'sub' / 'empty.d').mkdir()
+    (tmp_path / 'data.bin').write_bytes(b'x' * 10)
+
+    tree = FileSystemTree(str(tmp_path))
+    view = build_view(tree, ['extension'])
+    assert [t._name for t in view._subtrees] == ['.bin']
+
+    view = build_view(tree, ['directory'])
+    assert [t._name for t in view._subtrees] == [tmp_path.name]
+
+
+def test_diff_trees() -> None:
+    """Test that a diff keeps only the leaves that grew, by their growth."""
+    old = FileSystemTree(EXAMPLE_PATH)
+    new = FileSystemTree(EXAMPLE_PATH)
+    _sort_subtrees(new)
+    activities, draft, prep = new._subtrees
+    reading = prep._subtrees[1]
+    old_size = reading.data_size
+    reading.change_size(0.5)
+    draft.change_size(-0.5)
+    new.update_data_sizes()
+
+    delta = diff_trees(old, new)
+    assert delta._name == 'workshop'
+    assert delta.data_size == reading.data_size - old_size
+    assert [t._name for t in delta._subtrees] == ['prep']
+    assert [t._name for t in delta._subtrees[0]._subtrees] == ['reading.md']
+
+
+def test_diff_snapshots(tmp_path) -> None:
+    """Test diffing saved snapshots, including new and removed files."""
+    (tmp_path / 'a').mkdir()
+    (tmp_path / 'a' / 'old.txt').write_bytes(b'x' * 10)
+    (tmp_path / 'b.txt').write_bytes(b'x' * 10)
+    save_snapshot(FileSystemTree(str(tmp_path)), str(tmp_path / '1.snap'))
+
+    (tmp_path / 'a' / 'old.txt').unlink()
+    (tmp_path / 'a' / 'new.txt').write_bytes(b'x' * 5)
+    (tmp_path / 'b.txt').write_bytes(b'x' * 25)
+    (tmp_path / 'c.txt').write_bytes(b'x' * 3)
+    save_snapshot(FileSystemTree(str(tmp_path)), str(tmp_path / '2.snap'))
+
+    delta = diff_snapshots(str(tmp_path / '1.snap'), str(tmp_path / '2.snap'))
+    sizes = {t._name: t.data_size for t in delta._subtrees}
+    assert sizes['a'] == 5
+    assert sizes['b.txt'] == 15
+    assert sizes['c.txt'] == 3
+    # the first snapshot file is itself new in the second scan
+    assert sizes['1.snap'] > 0
+    assert len(sizes) == 4
+
+
+def test_profiler() -> None:
+    """Test that the profiler counts and times calls only while enabled."""
+    tree = FileSystemTree(EXAMPLE_PATH)
+    get_rectangles = TMTree.get_rectangles
+    profiler = Profiler()
+    with profiler.phase('disabled'):
+        tree.update_rectangles((0, 0, 200, 100))
+
+    profiler.enable()
+    try:
+        tree.expand_all()
+        tree.update_rectangles((0, 0, 200, 100))
+        with profiler.phase('render'):
+            tree.get_rectangles()
+        tree.get_tree_at_position((0, 0))
+        assert len(list(tree.iter_rectangles())) == 6
+        profiler.end_frame(0.5)
+    finally:
+        profiler.disable()
+    assert TMTree.get_rectangles is get_rectangles
+
+    histograms = profiler.get_histograms()
+    assert 'disabled' not in histograms
+    assert histograms['update_rectangles']['count'] == 1
+    assert histograms['render']['count'] == 1
+    # get_rectangles is built on iter_rectangles
+    assert histograms['iter_rectangles']['count'] == 2
+
+    last_frame = profiler.get_last_frame()
+    assert last_frame['frame'] == 0.5
+    assert last_frame['update_rectangles'] == 11
+    assert last_frame['hit-test nodes'] == 11
+
+
+def test_compare_to_baseline() -> None:
+    """Test that only slowdowns and memory growth above their thresholds are
+    reported, and that a baseline without memory is compared on time only."""
+    baseline = [
+        {'benchmark': 'slower', 'size': 10, 'seconds': 1.0,
+         'peak_memory': 100},
+        {'benchmark': 'larger', 'size': 10, 'seconds': 1.0,
+         'peak_memory': 100},
+        {'benchmark': 'within', 'size': 10, 'seconds': 1.0,
+         'peak_memory': 100},
+        {'benchmark': 'no memory', 'size': 10, 'seconds': 1.0}
+    ]
+    results = [
+        {'benchmark': 'slower', 'size': 10, 'seconds': 1.3,
+         'peak_memory': 100},
+        {'benchmark': 'larger', 'size': 10, 'seconds': 1.0,
+         'peak_memory': 120},
+        {'benchmark': 'within', 'size': 10, 'seconds': 1.1,
+         'peak_memory': 105},
+        {'benchmark': 'no memory', 'size': 10, 'seconds': 1.1,
+         'peak_memory': 10 ** 9},
+        {'benchmark': 'slower', 'size': 20, 'seconds': 9.0,
+         'peak_memory': 900}
+    ]
+
+    regressions = benchmark.compare_to_baseline(results, baseline, 0.2, 0.1)
+    assert len(regressions) == 2
+    assert regressions[0].startswith('slower at size 10:')
+    assert regressions[1].startswith('larger at size 10:')
+
+    results[3]['seconds'] = 1.5
+    regressions = benchmark.compare_to_baseline(results, baseline, 0.2, 0.1)
+    assert regressions[2].startswith('no memory at size 10:')
+
+
+def test_benchmark_main(tmp_path) -> None:
+    """Test a tiny run of the benchmark suite, and its exit status against
+    its own results as the baseline."""
+    output = str(tmp_path / 'results.json')
+    args = ['--sizes', '100', '--paper-rows', '10', '--move-leaves', '10',
+            '--repeat', '1', '--output', output]
+    assert benchmark.main(args) == 0
+
+    with open(output) as results_file:
+        results = json.load(results_file)['results']
+    sizes = {result['benchmark']: result['size'] for result in results}
+    assert sizes['update_rectangles'] == 100
+    assert sizes['PaperTree'] == 10
+    assert sizes['move'] == 10
+    for result in results:
+        assert result['seconds'] >= 0 and result['peak_memory'] >= 0
+
+    # a threshold this large cannot be crossed by timing noise
+    assert benchmark.main(args[:-2] + ['--baseline', output, '--threshold',
+                                       '1000', '--memory-threshold',
+                                       '1000']) == 0
+
+
 ##############################################################################
 # Helpers
 ##############################################################################
@@ -95,6 +544,15 @@ def is_valid_colour(colour: Tuple[int, int, int]) -> bool:
     return True
 
 
+def _preorder(tree: TMTree) -> List[TMTree]:
+    """Return <tree> and all of its descendants, in preorder.
+    """
+    trees = [tree]
+    for subtree in tree._subtrees:
+        trees.extend(_preorder(subtree))
+    return trees
+
+
 def _sort_subtrees(tree: TMTree) -> None:
     """Sort the subtrees of <tree> in alphabetical order.
     THIS IS FOR THE PURPOSES OF THE SAMPLE TEST ONLY; This allows the sample 
@@ -110,5 +568,4 @@ def _sort_subtrees(tree: TMTree) -> None:
 
 
 if __name__ == '__main__':
-    import pytest
     pytest.main(['a2_sample_test.py'])
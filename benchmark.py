@@ -0,0 +1,434 @@
+"""
+=== Module Description ===
+This module contains a reproducible benchmark suite for the treemap
+visualiser. It builds synthetic trees of a configurable shape, times the
+operations on the hot paths of the visualiser at each of the given sizes,
+and writes the results as JSON.
+
+Each benchmark also reports the peak memory it allocated, as traced by
+tracemalloc in one extra, untimed run, since tracing slows allocation down.
+The results can be compared against a baseline saved by an earlier run, and
+the suite exits with status 1 if any benchmark got slower, or allocated more
+memory, than the baseline by more than the given thresholds.
+
+Example:
+    python benchmark.py --sizes 1000 100000 --output results.json
+    python benchmark.py --sizes 1000 100000 --baseline results.json
+"""
+import argparse
+import csv
+import json
+import math
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from tm_trees import TMTree, FileSystemTree
+import papers
+
+# The extensions given to the synthetic files, in turn.
+EXTENSIONS = ['.txt', '.py', '.pdf', '.png', '.csv']
+
+# The size of the treemap display used for the layout benchmarks.
+LAYOUT_RECT = (0, 0, 800, 570)
+
+# The number of hit-tests timed by the get_tree_at_position benchmark.
+HIT_TESTS = 100
+
+# The time, in seconds, and the peak memory, in bytes, of a benchmark.
+Measurement = Tuple[float, int]
+
+
+class SyntheticTree(TMTree):
+    """A tree generated for benchmarking, with no underlying data.
+
+    === Representation Invariants ===
+    - All TMTree RIs are inherited.
+    """
+
+    def get_separator(self) -> str:
+        """Returns the separator used in synthetic paths.
+        """
+        return '/'
+
+    def get_suffix(self) -> str:
+        """Returns the final descriptor of this tree.
+        """
+        if len(self._subtrees) == 0:
+            return ' (leaf)'
+        else:
+            return ' (node)'
+
+
+def get_size_generator(distribution: str,
+                       rng: random.Random) -> Callable[[], int]:
+    """Returns a function generating leaf sizes from <distribution>, which is
+    one of 'uniform', 'lognormal' or 'pareto'.
+    """
+    if distribution == 'uniform':
+        return lambda: rng.randint(1, 1000000)
+    elif distribution == 'lognormal':
+        return lambda: int(rng.lognormvariate(8, 2)) + 1
+    elif distribution == 'pareto':
+        return lambda: int(rng.paretovariate(1.2) * 1000)
+    else:
+        raise ValueError('unknown size distribution: ' + distribution)
+
+
+def get_fanout(nodes: int, fanout: int, depth: Optional[int]) -> int:
+    """Returns the fanout of a tree of <nodes> nodes. If <depth> is given,
+    it is the smallest fanout for which the tree is at most that deep;
+    otherwise it is <fanout>.
+    """
+    if depth is None:
+        return fanout
+    return max(2, math.ceil(nodes ** (1 / depth)))
+
+
+def build_synthetic_tree(nodes: int, fanout: int,
+                         get_size: Callable[[], int]) -> SyntheticTree:
+    """Returns a complete tree of <nodes> nodes, in which every internal
+    node has <fanout> subtrees, except perhaps the last one. Leaf sizes are
+    drawn from <get_size>.
+    """
+    built = [None] * nodes
+
+    for i in range(nodes - 1, -1, -1):
+        first = fanout * i + 1
+        if first >= nodes:
+            name = 'f{}{}'.format(i, EXTENSIONS[i % len(EXTENSIONS)])
+            built[i] = SyntheticTree(name, [], get_size())
+        else:
+            last = min(first + fanout, nodes)
+            built[i] = SyntheticTree('d{}'.format(i), built[first:last])
+            # the subtrees are now only referenced by their parent
+            built[first:last] = [None] * (last - first)
+
+    return built[0]
+
+
+def make_synthetic_directory(root: str, nodes: int, fanout: int,
+                             get_size: Callable[[], int]) -> str:
+    """Creates a directory under <root> with the same shape as
+    build_synthetic_tree, and returns its path.
+
+    The files are created sparse, so that their size takes no disk space.
+    """
+    paths = [os.path.join(root, 'd0')]
+
+    for i in range(nodes):
+        if i > 0:
+            parent = (i - 1) // fanout
+            if fanout * i + 1 >= nodes:
+                name = 'f{}{}'.format(i, EXTENSIONS[i % len(EXTENSIONS)])
+            else:
+                name = 'd{}'.format(i)
+            paths.append(os.path.join(paths[parent], name))
+
+        if fanout * i + 1 < nodes:
+            os.mkdir(paths[i])
+        else:
+            with open(paths[i], 'wb') as synthetic_file:
+                synthetic_file.truncate(get_size())
+
+    return paths[0]
+
+
+def make_synthetic_papers(filename: str, rows: int,
+                          rng: random.Random) -> None:
+    """Writes a dataset of <rows> papers, in the format of papers.DATA_FILE,
+    to <filename>. Each paper is put three categories deep.
+    """
+    with open(filename, 'w', newline='') as csv_file:
+        writer = csv.writer(csv_file)
+        writer.writerow(['Author', 'Title', 'Year', 'Category', 'Url',
+                         'Citations'])
+
+        for i in range(rows):
+            category = ': '.join('C{}'.format(rng.randint(0, 9))
+                                 for _ in range(3))
+            writer.writerow(['Author {}'.format(i), 'Paper {}'.format(i),
+                             rng.randint(1970, 2019), category,
+                             'http://doi.org/{}'.format(i),
+                             rng.randint(0, 500)])
+
+
+def time_call(function: Callable[[], object], repeat: int) -> float:
+    """Returns the fastest time, in seconds, of <repeat> calls to
+    <function>.
+    """
+    best = math.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def trace_memory(function: Callable[[], Any]) -> Tuple[Any, int]:
+    """Returns the result of calling <function>, and the peak memory, in
+    bytes, allocated during the call, as traced by tracemalloc.
+    """
+    tracemalloc.start()
+    try:
+        result = function()
+        return result, tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def measure_call(function: Callable[[], object],
+                 repeat: int) -> Measurement:
+    """Returns the fastest time, in seconds, of <repeat> calls to
+    <function>, and the peak memory, in bytes, of one further traced call.
+    """
+    seconds = time_call(function, repeat)
+    return seconds, trace_memory(function)[1]
+
+
+def run_tree_benchmarks(nodes: int, args: argparse.Namespace,
+                        rng: random.Random) -> Dict[str, Measurement]:
+    """Returns the time taken and the peak memory allocated by each
+    operation on a synthetic tree of <nodes> nodes, built as described by
+    <args>.
+    """
+    results = {}
+    fanout = get_fanout(nodes, args.fanout, args.depth)
+    get_size = get_size_generator(args.distribution, rng)
+
+    if nodes <= args.max_fs_nodes:
+        with tempfile.TemporaryDirectory() as root:
+            path = make_synthetic_directory(root, nodes, fanout, get_size)
+            results['FileSystemTree'] = measure_call(
+                lambda: FileSystemTree(path), args.repeat)
+
+    # builds the tree once untraced, for the time, and once traced, for the
+    # memory, keeping only the second tree
+    seconds = time_call(lambda: build_synthetic_tree(nodes, fanout,
+                                                     get_size), 1)
+    tree, peak = trace_memory(lambda: build_synthetic_tree(nodes, fanout,
+                                                           get_size))
+    results['build_synthetic_tree'] = seconds, peak
+
+    # expands every node, so that every leaf is displayed
+    tree.expand_all()
+    results['update_rectangles'] = measure_call(
+        lambda: tree.update_rectangles(LAYOUT_RECT), args.repeat)
+    results['get_rectangles'] = measure_call(tree.get_rectangles,
+                                             args.repeat)
+
+    x, y, width, height = LAYOUT_RECT
+    positions = [(rng.randint(x, x + width), rng.randint(y, y + height))
+                 for _ in range(HIT_TESTS)]
+    results['get_tree_at_position'] = measure_call(
+        lambda: [tree.get_tree_at_position(pos) for pos in positions],
+        args.repeat)
+
+    results['update_data_sizes'] = measure_call(tree.update_data_sizes,
+                                                args.repeat)
+
+    render = get_headless_render()
+    if render is not None:
+        results['render_display'] = measure_call(lambda: render(tree),
+                                                 args.repeat)
+
+    return results
+
+
+def run_move_benchmark(leaves: int) -> Measurement:
+    """Returns the time taken to move <leaves> leaves, one at a time, from
+    one folder to another folder that already holds <leaves> leaves,
+    starting from the last one, where finding a leaf by scanning the
+    folder's subtrees would take longest, and the peak memory allocated while
+    moving them back.
+    """
+    moving = [SyntheticTree('f{}'.format(i), [], 1) for i in range(leaves)]
+    # the first leaf stays behind, so that the source is still a folder that
+    # the leaves can be moved back to
+    source = SyntheticTree('source', [SyntheticTree('first', [], 1)] + moving)
+    destination = SyntheticTree('destination',
+                                [SyntheticTree('g{}'.format(i), [], 1)
+                                 for i in range(leaves)])
+    SyntheticTree('root', [source, destination])
+    moving.reverse()
+
+    start = time.perf_counter()
+    move_all(moving, destination)
+    seconds = time.perf_counter() - start
+
+    peak = trace_memory(lambda: move_all(moving, source))[1]
+    assert len(source.get_subtrees()) == leaves + 1
+    return seconds, peak
+
+
+def move_all(trees: List[TMTree], destination: TMTree) -> None:
+    """Moves each of <trees> to <destination>, in order.
+    """
+    for tree in trees:
+        tree.move(destination)
+
+
+def run_paper_benchmark(rows: int, args: argparse.Namespace,
+                        rng: random.Random) -> Measurement:
+    """Returns the time taken and the peak memory allocated to build a
+    PaperTree from a synthetic dataset of <rows> papers.
+    """
+    with tempfile.TemporaryDirectory() as root:
+        filename = os.path.join(root, 'papers.csv')
+        make_synthetic_papers(filename, rows, rng)
+
+        old_data_file = papers.DATA_FILE
+        papers.DATA_FILE = filename
+        try:
+            return measure_call(
+                lambda: papers.PaperTree('CS1', [], all_papers=True),
+                args.repeat)
+        finally:
+            papers.DATA_FILE = old_data_file
+
+
+def get_headless_render() -> Optional[Callable[[TMTree], None]]:
+    """Returns a function rendering a tree with render_display to an
+    offscreen display, or None if pygame is not installed.
+    """
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+    try:
+        import pygame
+        import treemap_visualiser
+    except ImportError:
+        return None
+
+    pygame.init()
+    screen = pygame.display.set_mode((treemap_visualiser.WIDTH,
+                                      treemap_visualiser.HEIGHT))
+    return lambda tree: treemap_visualiser.render_display(screen, tree,
+                                                          None, None)
+
+
+def compare_to_baseline(results: List[Dict], baseline: List[Dict],
+                        threshold: float,
+                        memory_threshold: float) -> List[str]:
+    """Returns a description of every result in <results> that is slower
+    than the same benchmark in <baseline> by more than <threshold>, or that
+    allocated more memory by more than <memory_threshold>, each as a fraction
+    of the baseline.
+    """
+    base_results = {(r['benchmark'], r['size']): r for r in baseline}
+    regressions = []
+
+    for result in results:
+        base = base_results.get((result['benchmark'], result['size']))
+        if base is None:
+            continue
+
+        if result['seconds'] > base['seconds'] * (1 + threshold):
+            regressions.append('{} at size {}: {:.4f}s, baseline {:.4f}s'
+                               .format(result['benchmark'], result['size'],
+                                       result['seconds'], base['seconds']))
+        # baselines written before memory was traced have no peak to check
+        base_memory = base.get('peak_memory')
+        if base_memory is not None and \
+                result['peak_memory'] > base_memory * (1 + memory_threshold):
+            regressions.append('{} at size {}: {} bytes, baseline {} bytes'
+                               .format(result['benchmark'], result['size'],
+                                       result['peak_memory'], base_memory))
+
+    return regressions
+
+
+def add_result(results: List[Dict], benchmark: str, size: int,
+               measurement: Measurement) -> None:
+    """Adds the <measurement> of <benchmark> at <size> to <results>, and
+    prints it.
+    """
+    seconds, peak_memory = measurement
+    results.append({'benchmark': benchmark, 'size': size, 'seconds': seconds,
+                    'peak_memory': peak_memory})
+    print('{:>24} {:>10} {:10.4f}s {:>12}B'.format(benchmark, size, seconds,
+                                                   peak_memory))
+
+
+def parse_args(argv: List[str]) -> argparse.Namespace:
+    """Returns the command line options in <argv>.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--sizes', type=int, nargs='+',
+                        default=[1000, 10000, 100000],
+                        help='node counts of the synthetic trees')
+    parser.add_argument('--fanout', type=int, default=10,
+                        help='number of subtrees of each internal node')
+    parser.add_argument('--depth', type=int, default=None,
+                        help='maximum depth; overrides --fanout')
+    parser.add_argument('--distribution', default='lognormal',
+                        choices=['uniform', 'lognormal', 'pareto'],
+                        help='distribution of leaf sizes')
+    parser.add_argument('--paper-rows', type=int, nargs='*',
+                        default=[1000, 10000],
+                        help='row counts of the synthetic paper datasets')
+    parser.add_argument('--move-leaves', type=int, nargs='*',
+                        default=[100000],
+                        help='numbers of leaves moved between two wide '
+                             'folders')
+    parser.add_argument('--max-fs-nodes', type=int, default=100000,
+                        help='largest size at which FileSystemTree is timed, '
+                             'since it creates files on disk')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='number of runs of each benchmark; the fastest '
+                             'is reported')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='file to write the results to')
+    parser.add_argument('--baseline', help='results file to compare against')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='slowdown, as a fraction of the baseline time, '
+                             'that counts as a regression')
+    parser.add_argument('--memory-threshold', type=float, default=0.1,
+                        help='growth in peak memory, as a fraction of the '
+                             'baseline, that counts as a regression')
+    return parser.parse_args(argv)
+
+
+def main(argv: List[str]) -> int:
+    """Runs the benchmarks described by <argv>, and returns the exit status.
+    """
+    args = parse_args(argv)
+    rng = random.Random(args.seed)
+    results = []
+
+    for nodes in args.sizes:
+        for benchmark, measurement in run_tree_benchmarks(nodes, args,
+                                                          rng).items():
+            add_result(results, benchmark, nodes, measurement)
+
+    for rows in args.paper_rows:
+        add_result(results, 'PaperTree', rows,
+                   run_paper_benchmark(rows, args, rng))
+
+    for leaves in args.move_leaves:
+        add_result(results, 'move', leaves, run_move_benchmark(leaves))
+
+    config = vars(args).copy()
+    config['python'] = sys.version.split()[0]
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump({'config': config, 'results': results}, output_file,
+                      indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)['results']
+        regressions = compare_to_baseline(results, baseline, args.threshold,
+                                          args.memory_threshold)
+        for regression in regressions:
+            print('REGRESSION: ' + regression)
+        if regressions:
+            return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,167 @@
+"""
+=== Module Description ===
+This module contains FileViewTree, which is used to model alternative
+hierarchies over the files of a FileSystemTree, such as "bytes by extension"
+or "bytes by owner, then by directory".
+
+A view is built from the extension, owner and modification time that the
+FileSystemTree scanner already recorded for every file, so switching between
+views never touches the disk. Each level of a view groups the files by one
+of the keys in LEVELS, and the leaves of a view hold the total size of the
+files in their group.
+"""
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+from tm_trees import TMTree, FileSystemTree
+
+# Labels for the age buckets, with the age in seconds below which a file
+# falls into each bucket. Older files fall into OLDEST_BUCKET.
+DAY = 24 * 60 * 60
+AGE_BUCKETS = [(DAY, 'under a day'), (7 * DAY, 'under a week'),
+               (30 * DAY, 'under a month'), (365 * DAY, 'under a year')]
+OLDEST_BUCKET = 'over a year'
+
+# Label for files whose name has no extension.
+NO_EXTENSION = '(no extension)'
+
+
+class FileViewTree(TMTree):
+    """A tree representation of the files of a FileSystemTree, grouped by
+    some of their attributes rather than by folder.
+
+    === Inherited Attributes ===
+    rect:
+        The pygame rectangle representing this node in the treemap
+        visualization.
+    data_size:
+        The size of the data represented by this tree.
+    _colour:
+        The RGB colour value of the root of this tree.
+    _name:
+        The root value of this tree, or None if this tree is empty.
+    _subtrees:
+        The subtrees of this tree.
+    _parent_tree:
+        The parent tree of this tree; i.e., the tree that contains this tree
+        as a subtree, or None if this tree is not part of a larger tree.
+    _expanded:
+        Whether or not this tree is considered expanded for visualization.
+
+    === Representation Invariants ===
+    - All TMTree RIs are inherited.
+    """
+
+    def get_separator(self) -> str:
+        """Returns the separator between the groups of this view.
+        """
+        return ' > '
+
+    def get_suffix(self) -> str:
+        """Returns the final descriptor of this tree.
+        """
+        if len(self._subtrees) == 0:
+            return ' (files)'
+        else:
+            return ' (group)'
+
+
+def build_view(tree: FileSystemTree, levels: List[str],
+               now: Optional[float] = None) -> FileViewTree:
+    """Returns a view of the files in <tree>, grouped by each of <levels> in
+    turn.
+
+    Precondition: <levels> is not empty, and each level is a key of LEVELS.
+
+    Ages are measured from <now>, or from the current time if <now> is None.
+    """
+    if now is None:
+        now = time.time()
+    keys = [LEVELS[level] for level in levels]
+
+    # Maps each group's labels to the total size of the files in it.
+    totals = {}
+    _add_files(tree, '', keys, now, totals)
+
+    nested_dict = {}
+    for labels, size in totals.items():
+        cur_dict = nested_dict
+        for label in labels[:-1]:
+            if label not in cur_dict:
+                cur_dict[label] = {}
+            cur_dict = cur_dict[label]
+        cur_dict[labels[-1]] = size
+
+    name = '{} by {}'.format(tree.get_name(), ', '.join(levels))
+    return FileViewTree(name, _build_tree_from_dict(nested_dict))
+
+
+def _add_files(tree: FileSystemTree, directory: str,
+               keys: List[Callable[[FileSystemTree, str, float], str]],
+               now: float, totals: Dict[Tuple[str, ...], int]) -> None:
+    """Adds the size of every file in <tree> to the total for its group.
+    Folders are not files, even when they are empty.
+
+    <directory> is the path of the folder containing <tree>.
+    """
+    if not tree.is_dir:
+        labels = tuple(key(tree, directory, now) for key in keys)
+        totals[labels] = totals.get(labels, 0) + tree.data_size
+    else:
+        if directory:
+            path = directory + tree.get_separator() + tree.get_name()
+        else:
+            path = tree.get_name()
+
+        for subtree in tree.get_subtrees():
+            _add_files(subtree, path, keys, now, totals)
+
+
+def _build_tree_from_dict(nested_dict: Dict) -> List[FileViewTree]:
+    """Returns a list of trees from the nested dictionary <nested_dict>,
+    whose innermost values are the sizes of the leaves.
+    """
+    subtrees = []
+    for label in sorted(nested_dict):
+        value = nested_dict[label]
+        if isinstance(value, dict):
+            subtrees.append(FileViewTree(label, _build_tree_from_dict(value)))
+        else:
+            subtrees.append(FileViewTree(label, [], value))
+
+    return subtrees
+
+
+def _get_extension(tree: FileSystemTree, _directory: str, _now: float) -> str:
+    return tree.extension or NO_EXTENSION
+
+
+def _get_owner(tree: FileSystemTree, _directory: str, _now: float) -> str:
+    return 'uid {}'.format(tree.uid)
+
+
+def _get_age(tree: FileSystemTree, _directory: str, now: float) -> str:
+    age = now - tree.mtime
+    for limit, label in AGE_BUCKETS:
+        if age < limit:
+            return label
+    return OLDEST_BUCKET
+
+
+def _get_directory(_tree: FileSystemTree, directory: str, _now: float) -> str:
+    return directory
+
+
+# The attributes that the levels of a view can group files by.
+LEVELS = {
+    'extension': _get_extension,
+    'owner': _get_owner,
+    'age': _get_age,
+    'directory': _get_directory
+}
+
+
+if __name__ == '__main__':
+    import python_ta
+    python_ta.check_all(config={
+        'allowed-import-modules': ['python_ta', 'typing', 'time', 'tm_trees']
+    })
@@ -0,0 +1,324 @@
+"""
+=== Module Description ===
+This module contains SearchIndex, an index over the names and paths of the
+nodes in a TMTree. It is built with a single walk over a finished tree and
+answers substring and glob queries without visiting every node.
+
+Names are indexed by their lowercase trigrams (every run of three
+consecutive characters), with START and END marking the ends of the name so
+that a query can also require a name to begin or end with some text. A query
+is answered by intersecting the trigram sets of its literal parts, and then
+checking only the surviving candidates.
+
+The path of every node is also materialised during the walk, both as is and
+in lowercase, so that exact path lookups and path queries do not need to
+recurse up to the root. A path query is narrowed by the trigrams of its last
+component, which must be the start of the name of some node on every
+matching path; the nodes below such a node match as well. Path queries
+assume that no name contains the separator.
+"""
+from __future__ import annotations
+import fnmatch
+from typing import Dict, List, Optional, Set
+from tm_trees import TMTree
+
+# Characters that make a query a glob pattern rather than a substring.
+GLOB_CHARS = '*?['
+
+# Characters marking the start and the end of a name in its trigrams.
+START = '\x02'
+END = '\x03'
+
+
+class SearchIndex:
+    """An index over the names and paths of every node in a TMTree.
+
+    === Private Attributes ===
+    _nodes:
+        Every indexed node, in the order they were visited (preorder).
+    _ids:
+        Maps id() of each indexed node to its position in _nodes.
+    _names:
+        The lowercase name of each node, parallel to _nodes.
+    _paths:
+        The materialised path of each node, parallel to _nodes.
+    _lower_paths:
+        The materialised lowercase path of each node, parallel to _nodes.
+    _by_path:
+        Maps each materialised path to the position of its node in _nodes.
+    _trigrams:
+        Maps each lowercase trigram to the positions of the nodes whose name,
+        between START and END, contains it.
+
+    === Representation Invariants ===
+    - _nodes, _names, _paths and _lower_paths all have the same length.
+    - For every i, _ids[id(_nodes[i])] == i and _by_path[_paths[i]] == i.
+    """
+
+    _nodes: List[TMTree]
+    _ids: Dict[int, int]
+    _names: List[str]
+    _paths: List[str]
+    _lower_paths: List[str]
+    _by_path: Dict[str, int]
+    _trigrams: Dict[str, Set[int]]
+
+    def __init__(self, tree: TMTree) -> None:
+        """Builds an index over <tree> and all of its descendants.
+        """
+        self._nodes = []
+        self._ids = {}
+        self._names = []
+        self._paths = []
+        self._lower_paths = []
+        self._by_path = {}
+        self._trigrams = {}
+
+        if not tree.is_empty():
+            self._add_subtree(tree, tree.get_name(), tree.get_name().lower())
+
+    def __len__(self) -> int:
+        """Returns the number of nodes in this index.
+        """
+        return len(self._nodes)
+
+    def search(self, query: str) -> List[TMTree]:
+        """Returns the nodes matching <query>, in preorder.
+
+        If <query> contains any of GLOB_CHARS, it is treated as a glob
+        pattern that must match the whole name; otherwise, it matches every
+        name containing it. If <query> contains the tree's separator, it is
+        matched against paths instead of names. Matching ignores case.
+        """
+        query = query.lower()
+        if not query or not self._nodes:
+            return []
+
+        is_glob = any(char in query for char in GLOB_CHARS)
+        separator = self._nodes[0].get_separator()
+
+        if is_glob and separator in query:
+            return [self._nodes[i]
+                    for i in self._get_path_candidates(query, separator)
+                    if fnmatch.fnmatchcase(self._lower_paths[i], query)]
+        elif is_glob:
+            return [self._nodes[i]
+                    for i in self._get_candidates(_get_glob_literals(query))
+                    if fnmatch.fnmatchcase(self._names[i], query)]
+        elif separator in query:
+            return [self._nodes[i]
+                    for i in self._search_paths(query, separator)]
+        else:
+            return [self._nodes[i] for i in self._get_candidates([query])
+                    if query in self._names[i]]
+
+    def find_path(self, path: str) -> Optional[TMTree]:
+        """Returns the node whose path is exactly <path>, or None if there
+        is no such node.
+        """
+        i = self._by_path.get(path)
+        if i is None:
+            return None
+        return self._nodes[i]
+
+    def get_path(self, node: TMTree) -> str:
+        """Returns the materialised path of <node>.
+
+        Precondition: <node> is in this index.
+        """
+        return self._paths[self._ids[id(node)]]
+
+    def update_path(self, node: TMTree, destination: TMTree) -> None:
+        """Updates the materialised paths of <node> and its descendants,
+        after <node> has been moved to be a subtree of <destination>.
+
+        Does nothing if <node> is not a subtree of <destination>, i.e., if
+        the move did not happen. Names are unaffected by moves, so the
+        trigrams are left unchanged.
+
+        Precondition: <node> and <destination> are in this index.
+        """
+        if node in destination.get_subtrees():
+            i = self._ids[id(destination)]
+            separator = node.get_separator()
+            self._update_paths(node,
+                               self._paths[i] + separator + node.get_name(),
+                               self._lower_paths[i] + separator +
+                               node.get_name().lower())
+
+    def rename(self, node: TMTree, name: str) -> None:
+        """Renames <node> to <name>, as in TMTree.rename, and updates the
+        indexed name of <node> and the paths of <node> and its descendants.
+
+        Precondition: <node> is in this index.
+        """
+        i = self._ids[id(node)]
+        for trigram in _get_trigrams(START + self._names[i] + END):
+            self._trigrams[trigram].discard(i)
+
+        # the paths of <node> up to, but not including, its name
+        path = self._paths[i][:len(self._paths[i]) - len(node.get_name())]
+        lower_path = self._lower_paths[i][:len(self._lower_paths[i]) -
+                                          len(self._names[i])]
+
+        node.rename(name)
+        self._names[i] = name.lower()
+        self._add_trigrams(i)
+        self._update_paths(node, path + name, lower_path + self._names[i])
+
+    def _add_subtree(self, tree: TMTree, path: str, lower_path: str) -> None:
+        i = len(self._nodes)
+        name = tree.get_name().lower()
+
+        self._nodes.append(tree)
+        self._ids[id(tree)] = i
+        self._names.append(name)
+        self._paths.append(path)
+        self._lower_paths.append(lower_path)
+        self._by_path[path] = i
+
+        self._add_trigrams(i)
+
+        separator = tree.get_separator()
+        for subtree in tree.get_subtrees():
+            name = subtree.get_name()
+            self._add_subtree(subtree, path + separator + name,
+                              lower_path + separator + name.lower())
+
+    def _add_trigrams(self, i: int) -> None:
+        for trigram in _get_trigrams(START + self._names[i] + END):
+            if trigram not in self._trigrams:
+                self._trigrams[trigram] = set()
+            self._trigrams[trigram].add(i)
+
+    def _update_paths(self, tree: TMTree, path: str, lower_path: str) -> None:
+        i = self._ids[id(tree)]
+
+        if self._by_path.get(self._paths[i]) == i:
+            del self._by_path[self._paths[i]]
+        self._paths[i] = path
+        self._lower_paths[i] = lower_path
+        self._by_path[path] = i
+
+        separator = tree.get_separator()
+        for subtree in tree.get_subtrees():
+            name = subtree.get_name()
+            self._update_paths(subtree, path + separator + name,
+                               lower_path + separator + name.lower())
+
+    def _search_paths(self, query: str, separator: str) -> List[int]:
+        """Returns the positions of the nodes whose lowercase path contains
+        <query>, in increasing order.
+
+        Each occurrence of <query> ends inside the name of some node, its
+        anchor, which is found from the trigrams of the last component of
+        <query>. The matching nodes are the anchors and their descendants.
+        """
+        last = query.rsplit(separator, 1)[1]
+        anchors = []
+
+        if last:
+            for i in self._get_candidates([START + last]):
+                # the position in the path just after <last>
+                end = len(self._lower_paths[i]) - len(self._names[i]) + \
+                    len(last)
+                if end >= len(query) and \
+                        self._lower_paths[i].startswith(query,
+                                                        end - len(query)):
+                    anchors.append(self._nodes[i])
+        else:
+            # <query> ends with the separator, so the anchors are the
+            # subtrees of the nodes whose path ends with the rest of it
+            rest = query[:-len(separator)]
+            parent_name = rest.rsplit(separator, 1)[-1]
+            for i in self._get_candidates([parent_name + END]):
+                if self._lower_paths[i].endswith(rest):
+                    anchors.extend(self._nodes[i].get_subtrees())
+
+        matches = set()
+        while anchors:
+            tree = anchors.pop()
+            i = self._ids.get(id(tree))
+            if i is not None and i not in matches:
+                matches.add(i)
+                anchors.extend(tree.get_subtrees())
+
+        return sorted(matches)
+
+    def _get_path_candidates(self, query: str, separator: str) -> List[int]:
+        """Returns the positions of the nodes whose lowercase path could
+        match the glob <query>, in increasing order.
+        """
+        literals = _get_glob_literals(query)
+        inner = [literal.strip(START + END) for literal in literals
+                 if separator in literal]
+
+        if inner:
+            # Every matching path contains each literal part of <query>.
+            return self._search_paths(max(inner, key=len), separator)
+        else:
+            # Every matching path ends with the last literal part of <query>,
+            # which holds no separator, so the name ends with it as well.
+            return self._get_candidates(literals[-1:])
+
+    def _get_candidates(self, literals: List[str]) -> List[int]:
+        """Returns the positions of the nodes whose name, between START and
+        END, contains every trigram of each of <literals>, in increasing
+        order.
+        """
+        candidates = None
+        for literal in literals:
+            for trigram in _get_trigrams(literal):
+                matches = self._trigrams.get(trigram, set())
+                if candidates is None:
+                    candidates = set(matches)
+                else:
+                    candidates &= matches
+                if not candidates:
+                    return []
+
+        if candidates is None:
+            # The query is too short to use any trigram.
+            return list(range(len(self._nodes)))
+        return sorted(candidates)
+
+
+def _get_trigrams(text: str) -> Set[str]:
+    """Returns the set of substrings of length 3 in <text>.
+    """
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def _get_glob_literals(pattern: str) -> List[str]:
+    """Returns the runs of literal characters in the glob <pattern>, with
+    START before the first run if <pattern> begins with it, and END after the
+    last run if <pattern> ends with it.
+
+    Character classes such as [abc] are dropped, since they do not
+    correspond to any fixed character.
+    """
+    literals = []
+    current = START
+    in_class = False
+
+    for char in pattern:
+        if in_class:
+            in_class = char != ']'
+        elif char in GLOB_CHARS:
+            in_class = char == '['
+            literals.append(current)
+            current = ''
+        else:
+            current += char
+    literals.append(current + END)
+
+    return literals
+
+
+if __name__ == '__main__':
+    import python_ta
+    python_ta.check_all(config={
+        'allowed-import-modules': [
+            'python_ta', 'typing', 'fnmatch', 'tm_trees', '__future__'
+        ]
+    })
@@ -0,0 +1,210 @@
+"""
+=== Module Description ===
+This module saves the leaves of a TMTree to snapshot files, and compares two
+trees or snapshots to build a DeltaTree showing how much each file grew.
+
+Both trees and snapshot files are read as streams of (path, size) pairs for
+their leaves, sorted by path. A path is the tuple of names from just below
+the root down to the leaf, so the leaves of a tree come out sorted when its
+subtrees are visited in order of name. Two sorted streams can then be
+compared in a single merged walk, in time linear in their lengths, while
+holding only one leaf of each in memory.
+
+A snapshot file holds the name of the root on its first line, followed by
+one leaf per line, each encoded as JSON.
+"""
+import json
+import os
+from typing import Iterator, List, Tuple
+from tm_trees import TMTree, FileSystemTree
+
+# A path from just below the root to a leaf, and the size of the leaf.
+Leaf = Tuple[Tuple[str, ...], int]
+
+
+class DeltaTree(TMTree):
+    """A tree representation of the growth of a file system between two scans.
+
+    The leaves are the files that grew, or that are new, and the data_size of
+    each is the number of bytes it grew by. Files that shrank, or that were
+    removed, are left out.
+
+    === Inherited Attributes ===
+    rect:
+        The pygame rectangle representing this node in the treemap
+        visualization.
+    data_size:
+        The size of the data represented by this tree.
+    _colour:
+        The RGB colour value of the root of this tree.
+    _name:
+        The root value of this tree, or None if this tree is empty.
+    _subtrees:
+        The subtrees of this tree.
+    _parent_tree:
+        The parent tree of this tree; i.e., the tree that contains this tree
+        as a subtree, or None if this tree is not part of a larger tree.
+    _expanded:
+        Whether or not this tree is considered expanded for visualization.
+
+    === Representation Invariants ===
+    - All TMTree RIs are inherited.
+    """
+
+    def get_separator(self) -> str:
+        """Returns the file separator for this OS.
+        """
+        return os.sep
+
+    def get_suffix(self) -> str:
+        """Returns the final descriptor of this tree.
+        """
+        if len(self._subtrees) == 0:
+            return ' (file growth)'
+        else:
+            return ' (folder growth)'
+
+
+def iter_leaves(tree: TMTree) -> Iterator[Leaf]:
+    """Yields the path and size of every leaf of <tree>, sorted by path.
+    """
+    for subtree in sorted(tree.get_subtrees(), key=TMTree.get_name):
+        yield from _iter_leaves(subtree, (subtree.get_name(),))
+
+
+def _iter_leaves(tree: TMTree, path: Tuple[str, ...]) -> Iterator[Leaf]:
+    subtrees = tree.get_subtrees()
+
+    if not subtrees:
+        yield path, tree.data_size
+    else:
+        for subtree in sorted(subtrees, key=TMTree.get_name):
+            yield from _iter_leaves(subtree, path + (subtree.get_name(),))
+
+
+def save_snapshot(tree: TMTree, filename: str) -> None:
+    """Saves the name of <tree> and the path and size of each of its leaves
+    to the snapshot file <filename>.
+    """
+    with open(filename, 'w') as snapshot_file:
+        snapshot_file.write(json.dumps(tree.get_name()) + '\n')
+
+        for path, size in iter_leaves(tree):
+            snapshot_file.write(json.dumps([path, size]) + '\n')
+
+
+def get_snapshot_name(filename: str) -> str:
+    """Returns the name of the root saved in the snapshot file <filename>.
+    """
+    with open(filename) as snapshot_file:
+        return json.loads(snapshot_file.readline())
+
+
+def load_snapshot(filename: str) -> Iterator[Leaf]:
+    """Yields the path and size of every leaf saved in the snapshot file
+    <filename>, sorted by path, reading one line at a time.
+    """
+    with open(filename) as snapshot_file:
+        # skips the name of the root
+        snapshot_file.readline()
+
+        for line in snapshot_file:
+            path, size = json.loads(line)
+            yield tuple(path), size
+
+
+def diff_leaves(old_leaves: Iterator[Leaf], new_leaves: Iterator[Leaf],
+                name: str) -> DeltaTree:
+    """Returns a DeltaTree named <name> of the growth of each leaf from
+    <old_leaves> to <new_leaves>.
+
+    Precondition: <old_leaves> and <new_leaves> are each sorted by path.
+    """
+    root = ('', [])
+    stack = [root]
+
+    for path, growth in _merge_growth(old_leaves, new_leaves):
+        # closes the folders on the stack that do not contain this leaf
+        common = 0
+        while common < min(len(stack) - 1, len(path) - 1) and \
+                stack[common + 1][0] == path[common]:
+            common += 1
+        while len(stack) - 1 > common:
+            _close_folder(stack)
+
+        for folder in path[len(stack) - 1:-1]:
+            stack.append((folder, []))
+        stack[-1][1].append(DeltaTree(path[-1], [], growth))
+
+    while len(stack) > 1:
+        _close_folder(stack)
+
+    return DeltaTree(name, root[1])
+
+
+def diff_trees(old: TMTree, new: TMTree) -> DeltaTree:
+    """Returns a DeltaTree of the growth of each leaf from <old> to <new>.
+    """
+    return diff_leaves(iter_leaves(old), iter_leaves(new), new.get_name())
+
+
+def diff_snapshots(old_filename: str, new_filename: str) -> DeltaTree:
+    """Returns a DeltaTree of the growth of each leaf from the snapshot file
+    <old_filename> to the snapshot file <new_filename>.
+    """
+    return diff_leaves(load_snapshot(old_filename),
+                       load_snapshot(new_filename),
+                       get_snapshot_name(new_filename))
+
+
+def diff_with_snapshot(old_filename: str, path: str) -> DeltaTree:
+    """Returns a DeltaTree of the growth of each file from the snapshot file
+    <old_filename> to a new scan of <path>.
+
+    Precondition: <path> is a valid path to a file or folder.
+    """
+    new = FileSystemTree(path)
+    return diff_leaves(load_snapshot(old_filename), iter_leaves(new),
+                       new.get_name())
+
+
+def _merge_growth(old_leaves: Iterator[Leaf],
+                  new_leaves: Iterator[Leaf]) -> Iterator[Leaf]:
+    """Yields the path and growth of every leaf in <new_leaves> that is
+    larger than the leaf with the same path in <old_leaves>, or that is not
+    in <old_leaves> at all, sorted by path.
+    """
+    old = next(old_leaves, None)
+    new = next(new_leaves, None)
+
+    while new is not None:
+        if old is not None and old[0] < new[0]:
+            old = next(old_leaves, None)
+            continue
+
+        path, size = new
+        if old is not None and old[0] == path:
+            size -= old[1]
+            old = next(old_leaves, None)
+        new = next(new_leaves, None)
+
+        if size > 0:
+            yield path, size
+
+
+def _close_folder(stack: List[Tuple[str, List[DeltaTree]]]) -> None:
+    """Pops the innermost folder off <stack> and adds it, as a DeltaTree, to
+    the subtrees of the folder containing it.
+    """
+    name, subtrees = stack.pop()
+    stack[-1][1].append(DeltaTree(name, subtrees))
+
+
+if __name__ == '__main__':
+    import python_ta
+    python_ta.check_all(config={
+        'allowed-import-modules': [
+            'python_ta', 'typing', 'json', 'os', 'tm_trees'
+        ],
+        'allowed-io': ['save_snapshot', 'get_snapshot_name', 'load_snapshot']
+    })
@@ -0,0 +1,238 @@
+"""
+=== Module Description ===
+This module contains Profiler, which counts and times the hot paths of the
+treemap visualiser, and PROFILER, the instance used by the visualiser.
+
+Profiling is disabled by default. While it is disabled, the TMTree methods
+are the original, unwrapped functions, and phase() returns a shared context
+manager that does nothing, so the cost is a single attribute check per
+phase. Enabling it replaces the TMTree methods in HOT_METHODS with wrappers
+that time each outermost call and count every call, including the
+recursive ones, i.e., the number of nodes each operation visits. The
+generators in HOT_ITERATORS are timed while they are iterated over, which
+excludes the time spent by the caller between items.
+
+Times are kept as histograms with one bucket per power of two microseconds,
+so memory use does not grow with the number of frames.
+"""
+from __future__ import annotations
+import contextlib
+import functools
+import json
+import math
+import time
+from typing import Callable, ContextManager, Dict, Iterator
+from tm_trees import TMTree
+
+# The TMTree methods that are timed while profiling is enabled.
+HOT_METHODS = ['get_tree_at_position', 'update_rectangles', 'get_rectangles',
+               'update_data_sizes']
+
+# The TMTree generators that are timed while profiling is enabled.
+HOT_ITERATORS = ['iter_rectangles']
+
+# The TMTree methods that are only counted, with the name of their counter.
+# These generators are called once for each node they visit.
+COUNTED_METHODS = {'_TMTree__iter_nodes_at_position': 'hit-test nodes',
+                   'iter_displayed_leaves': 'displayed-tree nodes'}
+
+# A context manager that does nothing, used for phases while disabled.
+_NULL_PHASE = contextlib.nullcontext()
+
+
+class Profiler:
+    """Counters and timers for the visualiser's hot paths.
+
+    === Public Attributes ===
+    enabled:
+        Whether or not calls and phases are being counted and timed.
+
+    === Private Attributes ===
+    _histograms:
+        Maps the name of each timed method or phase to its statistics: the
+        number of samples, their total and maximum in seconds, and the
+        number of samples in each power of two bucket of microseconds.
+    _counters:
+        Maps the name of each counter to its count in the current frame.
+    _last_frame:
+        The counters of the previous frame, and the time it took.
+    _active:
+        The names of the timed methods with a call in progress, so that only
+        the outermost of their recursive calls is timed.
+    _originals:
+        Maps the name of each wrapped TMTree method to the original function.
+    """
+
+    enabled: bool
+    _histograms: Dict[str, Dict]
+    _counters: Dict[str, int]
+    _last_frame: Dict[str, float]
+    _active: Dict[str, bool]
+    _originals: Dict[str, Callable]
+
+    def __init__(self) -> None:
+        """Initializes a new, disabled Profiler with no samples.
+        """
+        self.enabled = False
+        self._histograms = {}
+        self._counters = {}
+        self._last_frame = {}
+        self._active = {}
+        self._originals = {}
+
+    def enable(self) -> None:
+        """Starts counting and timing, by wrapping the TMTree hot methods.
+        """
+        if self.enabled:
+            return
+        self.enabled = True
+
+        for name in HOT_METHODS:
+            self._originals[name] = getattr(TMTree, name)
+            setattr(TMTree, name, self._wrap_timed(name,
+                                                   self._originals[name]))
+        for name in HOT_ITERATORS:
+            self._originals[name] = getattr(TMTree, name)
+            setattr(TMTree, name, self._wrap_timed_iterator(
+                name, self._originals[name]))
+        for name, counter in COUNTED_METHODS.items():
+            self._originals[name] = getattr(TMTree, name)
+            setattr(TMTree, name, self._wrap_counted(counter,
+                                                     self._originals[name]))
+
+    def disable(self) -> None:
+        """Stops counting and timing, and restores the TMTree methods.
+        """
+        for name, method in self._originals.items():
+            setattr(TMTree, name, method)
+        self._originals = {}
+        self.enabled = False
+
+    def phase(self, name: str) -> ContextManager:
+        """Returns a context manager that times its body as the phase <name>,
+        or that does nothing if profiling is disabled.
+        """
+        if not self.enabled:
+            return _NULL_PHASE
+        return self._time_phase(name)
+
+    def count(self, name: str, amount: int = 1) -> None:
+        """Adds <amount> to the counter <name> for the current frame.
+        """
+        if self.enabled:
+            self._counters[name] = self._counters.get(name, 0) + amount
+
+    def end_frame(self, seconds: float) -> None:
+        """Records that the current frame took <seconds>, and starts a new
+        frame.
+        """
+        self._last_frame = dict(self._counters)
+        self._last_frame['frame'] = seconds
+        self._counters = {}
+
+    def get_last_frame(self) -> Dict[str, float]:
+        """Returns the counters of the previous frame, along with the time
+        it took under 'frame'.
+        """
+        return self._last_frame
+
+    def get_histograms(self) -> Dict[str, Dict]:
+        """Returns the statistics of every timed method and phase.
+        """
+        return self._histograms
+
+    def dump(self, filename: str) -> None:
+        """Writes the statistics of every timed method and phase to the JSON
+        file <filename>.
+        """
+        with open(filename, 'w') as dump_file:
+            json.dump(self._histograms, dump_file, indent=2, sort_keys=True)
+
+    def record(self, name: str, seconds: float) -> None:
+        """Adds a sample of <seconds> to the histogram <name>.
+        """
+        if name not in self._histograms:
+            self._histograms[name] = {'count': 0, 'total': 0.0, 'max': 0.0,
+                                      'buckets_us': {}}
+        histogram = self._histograms[name]
+        histogram['count'] += 1
+        histogram['total'] += seconds
+        histogram['max'] = max(histogram['max'], seconds)
+
+        # the bucket is keyed by its upper bound, in microseconds
+        bucket = str(2 ** max(0, math.ceil(math.log2(max(seconds * 1e6,
+                                                         1)))))
+        histogram['buckets_us'][bucket] = \
+            histogram['buckets_us'].get(bucket, 0) + 1
+
+    @contextlib.contextmanager
+    def _time_phase(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def _wrap_timed(self, name: str, method: Callable) -> Callable:
+        @functools.wraps(method)
+        def wrapper(*args, **kwargs):
+            self._counters[name] = self._counters.get(name, 0) + 1
+            if self._active.get(name):
+                return method(*args, **kwargs)
+
+            self._active[name] = True
+            start = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                self._active[name] = False
+                self.record(name, time.perf_counter() - start)
+
+        return wrapper
+
+    def _wrap_timed_iterator(self, name: str, method: Callable) -> Callable:
+        @functools.wraps(method)
+        def wrapper(*args, **kwargs):
+            self._counters[name] = self._counters.get(name, 0) + 1
+            return self._time_iterator(name, method(*args, **kwargs))
+
+        return wrapper
+
+    def _time_iterator(self, name: str, iterator: Iterator) -> Iterator:
+        seconds = 0.0
+        try:
+            while True:
+                start = time.perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+                finally:
+                    seconds += time.perf_counter() - start
+                yield item
+        finally:
+            # also records iterations that the caller stopped early
+            self.record(name, seconds)
+
+    def _wrap_counted(self, counter: str, method: Callable) -> Callable:
+        @functools.wraps(method)
+        def wrapper(*args, **kwargs):
+            self._counters[counter] = self._counters.get(counter, 0) + 1
+            return method(*args, **kwargs)
+
+        return wrapper
+
+
+# The profiler used by the visualiser.
+PROFILER = Profiler()
+
+
+if __name__ == '__main__':
+    import python_ta
+    python_ta.check_all(config={
+        'allowed-import-modules': [
+            'python_ta', 'typing', 'contextlib', 'functools', 'json', 'math',
+            'time', 'tm_trees', '__future__'
+        ],
+        'allowed-io': ['dump']
+    })
@@ -6,10 +6,19 @@ files and folders on the computer's file system.
 """
 
 from __future__ import annotations
+import itertools
 import os
 import math
-from random import randint
-from typing import List, Tuple, Optional
+import stat
+import sys
+import zlib
+from collections.abc import Sequence
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Tuple, \
+    Optional, Set, Union
+
+
+# The ways assign_colours can derive a tree's colour.
+COLOUR_SCHEMES = ('path', 'depth', 'extension')
 
 
 class TMTree:
@@ -25,16 +34,29 @@ class TMTree:
 
     === Private Attributes ===
     _colour:
-        The RGB colour value of the root of this tree.
+        The RGB colour value of the root of this tree. It is looked up in
+        _colours, which is filled in for the whole tree by assign_colours
+        the first time any tree's colour is needed.
+    _colours:
+        The RGB colour values of every tree that this tree's colour was
+        assigned along with, three bytes each, or None if it has not been
+        assigned a colour yet.
+    _colour_index:
+        The position of this tree's colour in _colours.
     _name:
         The root value of this tree, or None if this tree is empty.
     _subtrees:
-        The subtrees of this tree.
+        The subtrees of this tree, in the order they are laid out.
     _parent_tree:
         The parent tree of this tree; i.e., the tree that contains this tree
         as a subtree, or None if this tree is not part of a larger tree.
     _expanded:
         Whether or not this tree is considered expanded for visualization.
+    _path:
+        The cached string representation of the path from the tree root to
+        this tree, without a suffix, or None if it has not been computed.
+        Only trees with subtrees cache their path, which each of their
+        subtrees shares as the prefix of its own.
 
     === Representation Invariants ===
     - data_size >= 0
@@ -53,19 +75,24 @@ class TMTree:
     - if _expanded is False, then _expanded is False for every tree
       in _subtrees
     - if _subtrees is empty, then _expanded is False
+
+    - if _path is not None, then _parent_tree is None or
+      _parent_tree._path is not None
     """
 
     rect: Tuple[int, int, int, int]
     data_size: int
-    _colour: Tuple[int, int, int]
+    _colours: Optional[bytearray]
+    _colour_index: int
     _name: Optional[str]
-    _subtrees: List[TMTree]
+    _subtrees: SubtreeList
     _parent_tree: Optional[TMTree]
     _expanded: bool
+    _path: Optional[str]
 
     def __init__(self, name: str, subtrees: List[TMTree],
                  data_size: int = 0) -> None:
-        """Initializes a new TMTree with a random colour and the provided <name>.
+        """Initializes a new TMTree with the provided <name>.
 
         If <subtrees> is empty, uses <data_size> to initialize this tree's
         data_size.
@@ -79,37 +106,69 @@ class TMTree:
         """
         self.rect = (0, 0, 0, 0)
         self.data_size = data_size
-        self._colour = tuple([randint(0, 255) for _ in range(3)])
+        self._colours = None
+        self._colour_index = 0
         self._name = name
-        self._subtrees = subtrees[:]
+        self._subtrees = SubtreeList(subtrees)
         self._parent_tree = None
         self._expanded = False
+        self._path = None
 
-        # 1. Initializes self._colour and self.data_size, according to the
-        # docstring.
+        # 1. Initializes self.data_size, according to the docstring.
         if self._subtrees:
             self.data_size = 0
             for subtree in self._subtrees:
                 self.data_size += subtree.data_size
 
         if self._name is None:
-            self._subtrees = []
+            self._subtrees = SubtreeList()
             self.data_size = 0
 
         # 2. Sets this tree as the parent for each of its subtrees.
         for subtree in self._subtrees:
             subtree._parent_tree = self
+            subtree.__invalidate_paths()
+
+    @property
+    def _colour(self) -> Tuple[int, int, int]:
+        if self._colours is None:
+            root = self
+            while root._parent_tree is not None:
+                root = root._parent_tree
+            root.assign_colours()
+
+        i = self._colour_index
+        return self._colours[i], self._colours[i + 1], self._colours[i + 2]
 
     def is_empty(self) -> bool:
         """Returns True iff this tree is empty.
         """
         return self._name is None
 
-    def get_subtrees(self) -> List[TMTree]:
+    def get_subtrees(self) -> SubtreeList:
         """Returns subtrees of TMTree
         """
         return self._subtrees
 
+    def get_name(self) -> Optional[str]:
+        """Returns the name of TMTree
+        """
+        return self._name
+
+    def assign_colours(self, scheme: str = 'path') -> None:
+        """Assigns a colour to this tree and each of its descendants, in a
+        single pass, derived from a hash of the tree's path, depth or name
+        extension, according to <scheme>.
+
+        The colours are the same every time the same tree is coloured, and
+        are stored together in one bytearray.
+
+        Precondition: <scheme> is one of COLOUR_SCHEMES.
+        """
+        if scheme not in COLOUR_SCHEMES:
+            raise ValueError('unknown colour scheme: ' + scheme)
+        self.__assign_colours(scheme, bytearray(), self._name or '', 0)
+
     def update_rectangles(self, rect: Tuple[int, int, int, int]) -> None:
         """Updates the rectangles in this tree and its descendents using the
         treemap algorithm to fill the area defined by pygame rectangle <rect>.
@@ -148,15 +207,28 @@ class TMTree:
         appropriate pygame rectangle to display for a leaf, and the colour
         to fill it with.
         """
-        lst = []
+        return list(self.iter_rectangles())
+
+    def iter_rectangles(self) -> Iterator[Tuple[Tuple[int, int, int, int],
+                                                Tuple[int, int, int]]]:
+        """Yields the same tuples as get_rectangles, in the same order,
+        without building a list.
+        """
+        for leaf in self.iter_displayed_leaves():
+            yield leaf.rect, leaf._colour
+
+    def iter_displayed_leaves(self) -> Iterator[TMTree]:
+        """Yields every leaf in the displayed-tree rooted at this tree, from
+        left to right.
 
+        Only one generator is alive for each level of the tree at a time, so
+        the memory used is proportional to the depth of this tree.
+        """
         if self.__is_in_displayed_tree():
-            lst.append((self.rect, self._colour))
+            yield self
         else:
             for subtree in self._subtrees:
-                lst += subtree.get_rectangles()
-
-        return lst
+                yield from subtree.iter_displayed_leaves()
 
     def get_tree_at_position(self, pos: Tuple[int, int]) -> Optional[TMTree]:
         """Returns the leaf in the displayed-tree rooted at this tree whose
@@ -166,9 +238,7 @@ class TMTree:
         If <pos> is on the shared edge between two rectangles, returns the
         tree represented by the rectangle that is closer to the origin.
         """
-        leafs = self.__get_nodes_at_position(pos)
-
-        assert 0 <= len(leafs) <= 4
+        leafs = list(self.__iter_nodes_at_position(pos))
 
         if not leafs:
             return None
@@ -198,11 +268,24 @@ class TMTree:
     def move(self, destination: TMTree) -> None:
         """If this tree is a leaf, and <destination> is not a leaf, moves this
         tree to be the last subtree of <destination>. Otherwise, does nothing.
+
+        Updates the data_size of the old and new ancestors of this tree, so
+        that the move takes time proportional to their depth rather than to
+        the size of the whole tree.
         """
 
-        if self.__is_leaf() and not destination.__is_leaf():
-            self._parent_tree._subtrees.remove(self)
+        if self.__is_leaf() and not destination.__is_leaf() and \
+                self._parent_tree is not None:
+            old_parent = self._parent_tree
+            old_parent._subtrees.remove(self)
+            old_parent.__add_to_ancestor_sizes(-self.data_size)
+            if not old_parent._subtrees:
+                old_parent._expanded = False
+
             destination._subtrees.append(self)
+            destination.__add_to_ancestor_sizes(self.data_size)
+            self._parent_tree = destination
+            self.__invalidate_paths()
 
     def change_size(self, factor: float) -> None:
         """Changes the value of this tree's data_size attribute by <factor>.
@@ -220,6 +303,25 @@ class TMTree:
             if amount >= 1:
                 self.data_size = amount
 
+    def update_ancestor_sizes(self, amount: int) -> None:
+        """Adds <amount> to the data_size of each ancestor of this tree,
+        after this tree's data_size has changed by <amount>.
+
+        Takes time proportional to the depth of this tree, rather than to
+        the size of the whole tree as update_data_sizes does.
+        """
+        if self._parent_tree is not None:
+            self._parent_tree.__add_to_ancestor_sizes(amount)
+
+    def batch(self, rect: Tuple[int, int, int, int]) -> TreeBatch:
+        """Returns a new batch of edits to this tree, which updates the data
+        sizes and then the rectangles of this tree to fill <rect> once, when
+        it is committed.
+
+        Precondition: this tree is the root of the whole tree.
+        """
+        return TreeBatch(self, rect)
+
     def expand(self) -> None:
         if not self.__is_leaf():
             self._expanded = True
@@ -248,18 +350,32 @@ class TMTree:
         """Returns a string representing the path containing this tree
         and its ancestors, using the separator for this tree between each
         tree's name. If <final_node>, then adds the suffix for the tree.
+
+        The path of a tree with subtrees is computed once and cached, until
+        it is moved or renamed. A leaf does not cache a copy of its parent's
+        path, but appends its name to the parent's cached path when asked.
         """
-        if self._parent_tree is None:
-            path_str = self._name
-            if final_node:
-                path_str += self.get_suffix()
-            return path_str
+        if self._subtrees:
+            path = self.__get_cached_path()
         else:
-            path_str = (self._parent_tree.get_path_string(False) +
-                        self.get_separator() + self._name)
-            if final_node or len(self._subtrees) == 0:
-                path_str += self.get_suffix()
-            return path_str
+            path = self.__build_path()
+
+        if final_node or (self._parent_tree is not None and
+                          len(self._subtrees) == 0):
+            return path + self.get_suffix()
+        else:
+            return path
+
+    def rename(self, name: str) -> None:
+        """Changes the name of this tree to <name>.
+
+        A tree in a SearchIndex should be renamed with SearchIndex.rename
+        instead, so that the index stays up to date.
+
+        Precondition: this tree is not empty.
+        """
+        self._name = name
+        self.__invalidate_paths()
 
     def get_separator(self) -> str:
         """Returns the string used to separate names in the string
@@ -284,16 +400,61 @@ class TMTree:
         else:
             return False
 
-    def __get_nodes_at_position(self, pos: Tuple[int, int]) -> List[TMTree]:
+    def __iter_nodes_at_position(self, pos: Tuple[int, int]) \
+            -> Iterator[TMTree]:
         if self.__is_in_displayed_tree() and \
                 self.__check_pos_in_rect(pos, self.rect):
-            return [self]
+            yield self
         else:
-            leafs = []
             for subtree in self._subtrees:
-                leafs += subtree.__get_nodes_at_position(pos)
+                yield from subtree.__iter_nodes_at_position(pos)
+
+    def __assign_colours(self, scheme: str, colours: bytearray, path: str,
+                         depth: int) -> None:
+        if scheme == 'path':
+            key = path
+        elif scheme == 'depth':
+            key = str(depth)
+        else:
+            key = os.path.splitext(self._name or '')[1].lower()
+
+        self._colours = colours
+        self._colour_index = len(colours)
+        # the low three bytes of the hash are the red, green and blue values
+        colours += zlib.crc32(key.encode('utf-8', 'surrogateescape')) \
+            .to_bytes(4, 'big')[1:]
+
+        separator = self.get_separator() if self._subtrees else ''
+        for subtree in self._subtrees:
+            subtree.__assign_colours(scheme, colours,
+                                     path + separator + subtree._name,
+                                     depth + 1)
 
-            return leafs
+    def __get_cached_path(self) -> str:
+        if self._path is None:
+            self._path = self.__build_path()
+        return self._path
+
+    def __build_path(self) -> str:
+        if self._parent_tree is None:
+            return self._name
+        return self._parent_tree.__get_cached_path() + \
+            self.get_separator() + self._name
+
+    def __add_to_ancestor_sizes(self, amount: int) -> None:
+        tree = self
+        while tree is not None:
+            tree.data_size += amount
+            tree = tree._parent_tree
+
+    def __invalidate_paths(self) -> None:
+        # A tree's path is only cached if its parent's path is, so the
+        # descendants of a tree without a cached path need no work.
+        if self._path is not None:
+            self._path = None
+
+            for subtree in self._subtrees:
+                subtree.__invalidate_paths()
 
     def __collapse_descendants(self) -> None:
         self._expanded = False
@@ -303,25 +464,12 @@ class TMTree:
 
     @staticmethod
     def __get_leaf_closest_to_origin(leafs: List[TMTree]) -> TMTree:
-
-        for l1 in leafs:
-            closest_to_origin = True
-            for l2 in leafs:
-
-                if l1 == l2:
-                    continue
-
-                l1x, l1y, l1width, l1height = l1.rect
-                l2x, l2y, l2width, l2height = l2.rect
-
-                if not (l1x <= l2x and l1y <= l2y):
-                    closest_to_origin = False
-                    break
-
-            if closest_to_origin:
-                return l1
-
-        return None
+        # Usually at most 4 leaves share <pos>, one of which is above and to
+        # the left of the others. Rectangles shrunk to zero width or height
+        # can stack many more leaves on one point, so this picks the leaf
+        # nearest the origin in a single pass instead.
+        return min(leafs, key=lambda leaf: (leaf.rect[0] + leaf.rect[1],
+                                            leaf.rect[0]))
 
     @staticmethod
     def __divide_length(total_length: int, total_size: int,
@@ -349,6 +497,207 @@ class TMTree:
             return False
 
 
+class SubtreeList(Sequence):
+    """The subtrees of a TMTree, in order.
+
+    Appending a tree, removing a tree, and checking whether a tree is in the
+    list all take constant time, however many subtrees there are, since the
+    trees are kept in a dict keyed by their id, which remembers the order
+    they were added in. Positional access is linear: indexing takes time
+    proportional to the position, and index takes a single pass over the
+    trees.
+
+    === Private Attributes ===
+    _trees:
+        Maps the id of each subtree to the subtree, in order.
+    """
+
+    _trees: Dict[int, TMTree]
+
+    def __init__(self, trees: Iterable[TMTree] = ()) -> None:
+        """Initializes a new SubtreeList holding <trees>, in order.
+
+        Precondition: no tree appears twice in <trees>.
+        """
+        self._trees = {id(tree): tree for tree in trees}
+
+    def __len__(self) -> int:
+        return len(self._trees)
+
+    def __iter__(self) -> Iterator[TMTree]:
+        return iter(self._trees.values())
+
+    def __reversed__(self) -> Iterator[TMTree]:
+        return reversed(self._trees.values())
+
+    def __contains__(self, tree: object) -> bool:
+        return self._trees.get(id(tree)) is tree
+
+    def __getitem__(self, index: Union[int, slice]) \
+            -> Union[TMTree, List[TMTree]]:
+        if isinstance(index, slice):
+            return list(self)[index]
+
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('subtree index out of range')
+        return next(itertools.islice(self._trees.values(), index, None))
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, (SubtreeList, list, tuple)):
+            return list(self) == list(other)
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return 'SubtreeList({!r})'.format(list(self))
+
+    def index(self, tree: TMTree, start: int = 0,
+              stop: Optional[int] = None) -> int:
+        """Returns the position of <tree> in this list, searching only from
+        <start> to <stop>, as list.index does.
+
+        Raises ValueError if <tree> is not in that part of this list.
+        """
+        if tree in self:
+            start, stop, _ = slice(start, stop).indices(len(self))
+            trees = itertools.islice(self._trees.values(), start, stop)
+            for i, subtree in enumerate(trees, start):
+                if subtree is tree:
+                    return i
+        raise ValueError('tree is not a subtree')
+
+    def count(self, tree: TMTree) -> int:
+        """Returns the number of times <tree> is in this list, i.e., 1 if it
+        is in this list and 0 otherwise.
+        """
+        return int(tree in self)
+
+    def append(self, tree: TMTree) -> None:
+        """Adds <tree> to the end of this list.
+
+        Precondition: <tree> is not in this list.
+        """
+        self._trees[id(tree)] = tree
+
+    def remove(self, tree: TMTree) -> None:
+        """Removes <tree> from this list, keeping the order of the others.
+
+        Raises ValueError if <tree> is not in this list.
+        """
+        if tree not in self:
+            raise ValueError('tree is not a subtree')
+        del self._trees[id(tree)]
+
+    def sort(self, key: Optional[Callable[[TMTree], Any]] = None,
+             reverse: bool = False) -> None:
+        """Sorts this list in place, as list.sort does.
+        """
+        trees = sorted(self._trees.values(), key=key, reverse=reverse)
+        self._trees = {id(tree): tree for tree in trees}
+
+
+class TreeBatch:
+    """A batch of edits to a TMTree.
+
+    Each edit is applied to the tree as soon as it is made, but the data
+    sizes and rectangles of the tree are only updated when the batch is
+    committed, once for all of the edits since the last commit. Until then,
+    the data_size and rect of the edited trees' ancestors are out of date.
+    Committing adds the total change in size of each resized leaf to its
+    ancestors, and then lays out the whole tree once.
+
+    Trees are expanded and collapsed directly, rather than through a batch,
+    since that changes neither data sizes nor rectangles: the rectangles of
+    every tree are kept up to date, displayed or not.
+
+    A batch can be used as a context manager, which commits it at the end of
+    the with statement.
+
+    === Private Attributes ===
+    _tree:
+        The root of the tree being edited.
+    _rect:
+        The pygame rectangle that the treemap of _tree fills.
+    _size_changes:
+        Maps the id of each leaf resized since the last commit to the leaf
+        and the total change in its data_size, which its ancestors do not
+        include yet.
+    _layout_dirty:
+        Whether or not an edit since the last commit changed a data size or
+        moved a tree.
+    """
+
+    _tree: TMTree
+    _rect: Tuple[int, int, int, int]
+    _size_changes: Dict[int, Tuple[TMTree, int]]
+    _layout_dirty: bool
+
+    def __init__(self, tree: TMTree, rect: Tuple[int, int, int, int]) -> None:
+        """Initializes a new, empty batch of edits to <tree>, whose treemap
+        fills <rect>.
+        """
+        self._tree = tree
+        self._rect = rect
+        self._size_changes = {}
+        self._layout_dirty = False
+
+    def __enter__(self) -> TreeBatch:
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        if exc_type is None:
+            self.commit()
+
+    def change_size(self, tree: TMTree, factor: float) -> None:
+        """Changes the data_size of <tree> by <factor>, as in
+        TMTree.change_size.
+
+        Does nothing if <tree> is not a leaf, since its data_size is the sum
+        of the data_size of its subtrees.
+        """
+        if tree.get_subtrees():
+            return
+
+        old_size = tree.data_size
+        tree.change_size(factor)
+        _, change = self._size_changes.get(id(tree), (tree, 0))
+        change += tree.data_size - old_size
+        self._size_changes[id(tree)] = (tree, change)
+        self._layout_dirty = True
+
+    def move(self, tree: TMTree, destination: TMTree) -> None:
+        """Moves <tree> to <destination>, as in TMTree.move.
+
+        TMTree.move keeps the data sizes up to date, so only the rectangles
+        need to be updated when the batch is committed. A change to the size
+        of <tree> earlier in this batch is first added to its old ancestors.
+        """
+        if id(tree) in self._size_changes:
+            _, change = self._size_changes.pop(id(tree))
+            tree.update_ancestor_sizes(change)
+        tree.move(destination)
+        self._layout_dirty = True
+
+    def is_dirty(self) -> bool:
+        """Returns True iff committing this batch would update the data
+        sizes and rectangles of the tree.
+        """
+        return self._layout_dirty
+
+    def commit(self) -> None:
+        """Updates the data sizes of the tree, and then its rectangles, if
+        the edits since the last commit need them.
+        """
+        for tree, change in self._size_changes.values():
+            tree.update_ancestor_sizes(change)
+        self._size_changes = {}
+
+        if self._layout_dirty:
+            self._tree.update_rectangles(self._rect)
+            self._layout_dirty = False
+
+
 class FileSystemTree(TMTree):
     """A tree representation of files and folders in a file system.
 
@@ -359,12 +708,46 @@ class FileSystemTree(TMTree):
     path. E.g., store 'assignments', not '/Users/Diane/csc148/assignments'
 
     The data_size attribute for regular files is simply the size of the file,
-    as reported by os.path.getsize.
+    as reported by os.stat. Optionally, a file with several hard links can be
+    counted only at its first link, and the space allocated to a file on disk
+    can be used instead of its size.
+
+    === Public Attributes ===
+    is_dir:
+        Whether or not this tree is a folder, which may be empty.
+    extension:
+        The lowercase extension of this file's name, including the leading
+        dot, or '' if it has none. Equal strings share a single object.
+    uid:
+        The user id of the owner of this file or folder.
+    mtime:
+        The time this file or folder was last modified, in whole seconds
+        since the epoch.
     """
 
-    def __init__(self, path: str) -> None:
+    is_dir: bool
+    extension: str
+    uid: int
+    mtime: int
+
+    def __init__(self, path: str, dedupe_links: bool = False,
+                 use_blocks: bool = False,
+                 stat_result: Optional[os.stat_result] = None,
+                 seen_inodes: Optional[Set[Tuple[int, int]]] = None) -> None:
         """Stores the file tree structure contained in the given file or folder.
 
+        Each file and folder is stat-ed exactly once. If <stat_result> is
+        given, it is used as the result of stat-ing <path>.
+
+        If <dedupe_links>, then a file with more than one hard link has its
+        size counted only the first time one of its links is found, and every
+        other link has size 0. <seen_inodes> holds the (device, inode) pairs
+        of the linked files found so far in the scan. On Windows, os.scandir
+        reports st_nlink and st_ino as 0, so <dedupe_links> has no effect.
+
+        If <use_blocks>, then the size of a file is the space allocated to it
+        on disk (st_blocks), where the OS reports it, rather than its length.
+
         Precondition: <path> is a valid path for this computer.
         >>> t = FileSystemTree('/Users/foramgandhi/Documents/CSC148')
         >>> t.is_empty()
@@ -372,18 +755,37 @@ class FileSystemTree(TMTree):
         """
 
         name = os.path.basename(path)
+        if stat_result is None:
+            stat_result = os.stat(path)
+        if seen_inodes is None:
+            seen_inodes = set()
+
+        self.is_dir = stat.S_ISDIR(stat_result.st_mode)
+        self.extension = sys.intern(os.path.splitext(name)[1].lower())
+        self.uid = stat_result.st_uid
+        self.mtime = int(stat_result.st_mtime)
+
+        if not self.is_dir:
+            size = _get_file_size(stat_result, use_blocks)
+
+            if dedupe_links and stat_result.st_nlink > 1:
+                inode = (stat_result.st_dev, stat_result.st_ino)
+                if inode in seen_inodes:
+                    size = 0
+                else:
+                    seen_inodes.add(inode)
 
-        if not os.path.isdir(path):
-            size = os.path.getsize(path)
             super(FileSystemTree, self).__init__(name, [], size)
 
         else:
             subtrees = []
 
-            for f_name in os.listdir(path):
-                f_path = os.path.join(path, f_name)
-                sub_t = FileSystemTree(f_path)
-                subtrees.append(sub_t)
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    sub_t = FileSystemTree(entry.path, dedupe_links,
+                                           use_blocks, entry.stat(),
+                                           seen_inodes)
+                    subtrees.append(sub_t)
 
             super(FileSystemTree, self).__init__(name, subtrees)
 
@@ -401,10 +803,24 @@ class FileSystemTree(TMTree):
             return ' (folder)'
 
 
+def _get_file_size(stat_result: os.stat_result, use_blocks: bool) -> int:
+    """Returns the size of the file described by <stat_result>.
+
+    If <use_blocks>, returns the space allocated to the file instead, in the
+    512-byte units used by st_blocks, unless the OS does not report it.
+    """
+    blocks = getattr(stat_result, 'st_blocks', None)
+    if use_blocks and blocks is not None:
+        return blocks * 512
+    else:
+        return stat_result.st_size
+
+
 if __name__ == '__main__':
     import python_ta
     python_ta.check_all(config={
         'allowed-import-modules': [
-            'python_ta', 'typing', 'math', 'random', 'os', '__future__'
+            'python_ta', 'typing', 'math', 'os', 'stat', 'sys', 'zlib',
+            'itertools', 'collections.abc', '__future__'
         ]
     })
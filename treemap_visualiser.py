@@ -6,10 +6,15 @@ concrete subclass, of course), rendering it to the user using pygame,
 and detecting user events like mouse clicks and key presses and responding
 to them.
 """
-from typing import Optional, Tuple
+import time
+from typing import Dict, List, Optional, Tuple
 import pygame
 from tm_trees import TMTree, FileSystemTree
 from papers import PaperTree
+from search_index import SearchIndex
+from file_views import build_view
+from snapshots import diff_with_snapshot
+from tm_profiler import PROFILER
 
 
 # Screen dimensions and coordinates
@@ -22,30 +27,72 @@ TREEMAP_HEIGHT = HEIGHT - FONT_HEIGHT  # The height of the treemap display.
 # Font to use for the treemap program.
 FONT_FAMILY = 'Consolas'
 
+# Colour of the outline drawn around search matches, and the maximum number
+# of matches that are outlined on each frame.
+MATCH_COLOUR = (255, 255, 0)
+MAX_HIGHLIGHTS = 1000
 
-def run_visualisation(tree: TMTree) -> None:
+# The height of the text in the profiling overlay.
+PROFILE_FONT_HEIGHT = 16
+
+# Milliseconds before a held key starts repeating, and between repeats.
+KEY_REPEAT_DELAY = 300
+KEY_REPEAT_INTERVAL = 30
+
+
+def run_visualisation(tree: TMTree, profile: bool = False,
+                      profile_output: Optional[str] = None,
+                      colour_scheme: str = 'path') -> None:
     """Displays an interactive graphical display of the given tree's treemap.
+
+    Each rectangle is coloured according to <colour_scheme>, one of
+    tm_trees.COLOUR_SCHEMES, so that the same tree is always drawn the same.
+
+    If <profile>, then the hot paths are counted and timed, and the frame
+    time and counters are shown in an overlay. If <profile_output> is also
+    given, the timing histograms are written to it when the window closes.
     """
 
     # Setup pygame
     pygame.init()
     screen = pygame.display.set_mode((WIDTH, HEIGHT))
+    pygame.key.set_repeat(KEY_REPEAT_DELAY, KEY_REPEAT_INTERVAL)
+
+    # Colour the whole tree in one pass, before anything is drawn.
+    tree.assign_colours(colour_scheme)
 
     # Render the initial display of the static treemap.
     render_display(screen, tree, None, None)
     tree.update_rectangles((0, 0, WIDTH, HEIGHT - FONT_HEIGHT))
 
+    # Build the search index once, before the event loop starts.
+    index = SearchIndex(tree)
+
+    if profile:
+        PROFILER.enable()
+
     # Start an event loop to respond to events.
-    event_loop(screen, tree)
+    try:
+        event_loop(screen, tree, index)
+    finally:
+        if profile:
+            if profile_output is not None:
+                PROFILER.dump(profile_output)
+            PROFILER.disable()
 
 
 def render_display(screen: pygame.Surface, tree: Optional[TMTree],
                    selected_node: Optional[TMTree],
-                   hover_node: Optional[TMTree]) -> None:
+                   hover_node: Optional[TMTree],
+                   matches: Optional[List[TMTree]] = None,
+                   search_text: Optional[str] = None) -> None:
     """Renders a treemap and text display to the given screen.
 
     Uses the constants TREEMAP_HEIGHT and FONT_HEIGHT to divide the
     screen vertically into the treemap and text comments.
+
+    Outlines up to MAX_HIGHLIGHTS of the trees in <matches>. If <search_text>
+    is given, it is displayed instead of the selected node's text.
     """
     # First, clear the screen
     pygame.draw.rect(screen, pygame.color.THECOLORS['black'],
@@ -53,9 +100,17 @@ def render_display(screen: pygame.Surface, tree: Optional[TMTree],
 
     subscreen = screen.subsurface((0, 0, WIDTH, TREEMAP_HEIGHT))
 
-    for rect, colour in tree.get_rectangles():
+    drawn = 0
+    for rect, colour in tree.iter_rectangles():
         # Note that the arguments are in the opposite order
         pygame.draw.rect(subscreen, colour, rect)
+        drawn += 1
+    PROFILER.count('rectangles drawn', drawn)
+
+    # outlines the search matches, even if they are inside a collapsed tree
+    if matches:
+        for match in matches[:MAX_HIGHLIGHTS]:
+            pygame.draw.rect(subscreen, MATCH_COLOUR, match.rect, 1)
 
     # adds the hover rectangle
     if selected_node is not None:
@@ -63,7 +118,13 @@ def render_display(screen: pygame.Surface, tree: Optional[TMTree],
     if hover_node is not None:
         pygame.draw.rect(subscreen, (255, 255, 255), hover_node.rect, 2)
 
-    _render_text(screen, _get_display_text(selected_node))
+    if search_text is None:
+        _render_text(screen, _get_display_text(selected_node))
+    else:
+        _render_text(screen, search_text)
+
+    if PROFILER.enabled:
+        _render_profile_overlay(screen, PROFILER.get_last_frame())
 
     # This must be called *after* all other pygame functions have run.
     pygame.display.flip()
@@ -80,59 +141,130 @@ def _render_text(screen: pygame.Surface, text: str) -> None:
     screen.blit(text_surface, text_pos)
 
 
-def event_loop(screen: pygame.Surface, tree: TMTree) -> None:
+def _render_profile_overlay(screen: pygame.Surface,
+                            last_frame: Dict[str, float]) -> None:
+    """Renders the frame time and counters of the previous frame at the top
+    of the display.
+    """
+    hit_tests = max(1, last_frame.get('get_tree_at_position', 0))
+    text = 'frame {:.1f} ms | nodes per hit-test {:.0f} | ' \
+           'rectangles drawn {}'.format(
+               last_frame.get('frame', 0) * 1000,
+               last_frame.get('hit-test nodes', 0) / hit_tests,
+               last_frame.get('rectangles drawn', 0))
+
+    font = pygame.font.SysFont(FONT_FAMILY, PROFILE_FONT_HEIGHT)
+    text_surface = font.render(text, 1, pygame.color.THECOLORS['white'],
+                               pygame.color.THECOLORS['black'])
+    screen.blit(text_surface, ORIGIN)
+
+
+def event_loop(screen: pygame.Surface, tree: TMTree,
+               index: SearchIndex) -> None:
     """Responds to events (mouse clicks, key presses) and update the display.
 
     Note that the event loop is an *infinite loop*: it continually waits for
     the next event, determines the event's type, and then updates the state
     of the visualisation or the tree itself, updating the display if necessary.
     This loop ends only when the user closes the window.
+
+    Pressing '/' starts a search of <index>: the typed query is run when
+    Enter is pressed, and Escape clears the query and its matches.
+
+    Edits are made in a batch, which is only committed, and the display only
+    updated, once no more events are waiting. Repeated key presses are
+    therefore coalesced into a single update of the tree's sizes and layout,
+    and the tree under the mouse is found once, after the commit. Clicks and
+    moves commit the batch first, so that they find the tree under the mouse
+    in an up to date layout.
     """
     selected_node = None
+    searching = False
+    query = ''
+    matches = []
+    batch = tree.batch((0, 0, WIDTH, HEIGHT - FONT_HEIGHT))
+    frame_start = time.perf_counter()
 
     while True:
         # Waits for an event
-        event = pygame.event.poll()
+        with PROFILER.phase('poll'):
+            event = pygame.event.poll()
         if event.type == pygame.QUIT:
             return
 
-        # gest the hover position and the corresponding node
-        hover_node = tree.get_tree_at_position(pygame.mouse.get_pos())
-
-        if event.type == pygame.MOUSEBUTTONUP:
-            selected_node = \
-                _handle_click(event.button, event.pos, tree, selected_node)
-
-        elif event.type == pygame.KEYUP and selected_node is not None:
-            if event.key == pygame.K_UP:
-                selected_node.change_size(0.01)
-                tree.update_data_sizes()
-                tree.update_rectangles((0, 0, WIDTH, HEIGHT - FONT_HEIGHT))
-
-            elif event.key == pygame.K_DOWN:
-                selected_node.change_size(-0.01)
-                tree.update_data_sizes()
-                tree.update_rectangles((0, 0, WIDTH, HEIGHT - FONT_HEIGHT))
-
-            elif event.key == pygame.K_m:
-                selected_node.move(hover_node)
-                tree.update_data_sizes()
-                tree.update_rectangles((0, 0, WIDTH, HEIGHT - FONT_HEIGHT))
-
-            elif event.key == pygame.K_e:
-                selected_node.expand()
-
-            elif event.key == pygame.K_a:
-                selected_node.expand_all()
-
-            elif event.key == pygame.K_c:
-                selected_node.collapse()
-
-            elif event.key == pygame.K_x:
-                selected_node.collapse_all()
+        with PROFILER.phase('handle'):
+            if searching and event.type == pygame.KEYDOWN:
+                if event.key == pygame.K_RETURN:
+                    matches = index.search(query)
+                    searching = False
+                elif event.key == pygame.K_ESCAPE:
+                    query = ''
+                    matches = []
+                    searching = False
+                elif event.key == pygame.K_BACKSPACE:
+                    query = query[:-1]
+                else:
+                    query += event.unicode
+
+            elif event.type == pygame.KEYDOWN and event.key == pygame.K_SLASH:
+                searching = True
+                query = ''
+
+            elif event.type == pygame.MOUSEBUTTONUP:
+                batch.commit()
+                selected_node = \
+                    _handle_click(event.button, event.pos, tree, selected_node)
+
+            # resizing repeats while the key is held down
+            elif event.type == pygame.KEYDOWN and selected_node is not None \
+                    and event.key in (pygame.K_UP, pygame.K_DOWN):
+                if event.key == pygame.K_UP:
+                    batch.change_size(selected_node, 0.01)
+                else:
+                    batch.change_size(selected_node, -0.01)
+
+            elif event.type == pygame.KEYUP and selected_node is not None \
+                    and not searching:
+                if event.key == pygame.K_m:
+                    batch.commit()
+                    destination = tree.get_tree_at_position(
+                        pygame.mouse.get_pos())
+                    if destination is not None:
+                        batch.move(selected_node, destination)
+                        index.update_path(selected_node, destination)
+
+                elif event.key == pygame.K_e:
+                    selected_node.expand()
+
+                elif event.key == pygame.K_a:
+                    selected_node.expand_all()
+
+                elif event.key == pygame.K_c:
+                    selected_node.collapse()
+
+                elif event.key == pygame.K_x:
+                    selected_node.collapse_all()
+
+        # Handles every waiting event before updating the tree and display
+        if event.type != pygame.NOEVENT:
+            continue
+
+        with PROFILER.phase('commit'):
+            batch.commit()
+
+        # gets the hover position and the corresponding node
+        with PROFILER.phase('hover'):
+            hover_node = tree.get_tree_at_position(pygame.mouse.get_pos())
 
         # Updates display
-        render_display(screen, tree, selected_node, hover_node)
+        with PROFILER.phase('render'):
+            render_display(screen, tree, selected_node, hover_node, matches,
+                           _get_search_text(searching, query, matches,
+                                            selected_node))
+
+        if PROFILER.enabled:
+            PROFILER.end_frame(time.perf_counter() - frame_start)
+        frame_start = time.perf_counter()
 
 
 def _handle_click(button: int, pos: Tuple[int, int], tree: TMTree,
@@ -166,15 +298,53 @@ def _get_display_text(leaf: Optional[TMTree]) -> str:
         return leaf.get_path_string() + '  ({})'.format(leaf.data_size)
 
 
-def run_treemap_file_system(path: str) -> None:
+def _get_search_text(searching: bool, query: str, matches: List[TMTree],
+                     selected_node: Optional[TMTree]) -> Optional[str]:
+    """Returns the text describing the current search, or None if the
+    selected node's text should be displayed instead.
+    """
+    if searching:
+        return 'Search: ' + query
+    elif query and selected_node is None:
+        return '{} matches for "{}"'.format(len(matches), query)
+    else:
+        return None
+
+
+def run_treemap_file_system(path: str, dedupe_links: bool = False,
+                            use_blocks: bool = False) -> None:
     """Runs a treemap visualisation for the given path's file structure.
 
+    If <dedupe_links>, files with several hard links are counted once. If
+    <use_blocks>, files are sized by the space allocated to them on disk.
+
     Precondition: <path> is a valid path to a file or folder.
     """
-    file_tree = FileSystemTree(path)
+    file_tree = FileSystemTree(path, dedupe_links, use_blocks)
     run_visualisation(file_tree)
 
 
+def run_treemap_file_view(path: str, levels: List[str]) -> None:
+    """Runs a treemap visualisation for the files under the given path,
+    grouped by each of <levels> in turn, e.g. ['extension', 'directory'].
+
+    Precondition: <path> is a valid path to a file or folder, and each of
+    <levels> is a key of file_views.LEVELS.
+    """
+    file_tree = FileSystemTree(path)
+    run_visualisation(build_view(file_tree, levels))
+
+
+def run_treemap_growth(snapshot_filename: str, path: str) -> None:
+    """Runs a treemap visualisation of how much each file under the given
+    path has grown since the snapshot saved in <snapshot_filename>.
+
+    Precondition: <path> is a valid path to a file or folder, and
+    <snapshot_filename> was saved by snapshots.save_snapshot.
+    """
+    run_visualisation(diff_with_snapshot(snapshot_filename, path))
+
+
 def run_treemap_papers() -> None:
     """Runs a treemap visualization for CS Education research papers data."""
     
@@ -186,7 +356,8 @@ if __name__ == '__main__':
     import python_ta
     python_ta.check_all(config={
         'allowed-import-modules': [
-            'python_ta', 'typing', 'pygame', 'tm_trees', 'papers'
+            'python_ta', 'typing', 'pygame', 'tm_trees', 'papers',
+            'search_index', 'file_views', 'snapshots', 'tm_profiler', 'time'
         ],
         'generated-members': 'pygame.*'
     })